@@ -0,0 +1,83 @@
+'''
+Measures the throughput of model records: the compiled per-class encoder
+against the generic per-field encoding it replaced, then each codec's
+encoding and decoding of the records, and the making of models from them.
+
+    python benchmarks/serializers.py [count]
+'''
+import gc
+import os
+import sys
+from io import BytesIO
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from kivy.properties import (DictProperty, ListProperty, NumericProperty,
+                             ObjectProperty, StringProperty)
+
+import pkas.pkas as pkas
+from pkas.pkas import (DataList, DataModel, DataProperty, FileContext,
+                       codecs, specify)
+
+
+@specify
+class Node(DataModel):
+    save = ['label', 'weight', 'parent', 'tags', 'meta', 'kids']
+    label = StringProperty('')
+    weight = NumericProperty(0)
+    parent = DataProperty()
+    tags = ListProperty()
+    meta = DictProperty()
+    kids = ObjectProperty(None, allownone=True)
+
+
+def generic_record(model):
+    record = {'__class__': model.__class__.__name__, '_id': model._id}
+    for name in model.save: record[name] = pkas._plain(getattr(model, name))
+    return record
+
+
+def rate(label, count, run):
+    gc.collect()
+    gc.disable()
+    start = perf_counter()
+    result = run()
+    elapsed = perf_counter() - start
+    gc.enable()
+    print('{:<28} {:>12,.0f} records/s'.format(label, count / elapsed))
+    return result
+
+
+def main(count=50000):
+    pkas.LOG = False
+    context = FileContext(name='benchmark')
+    models = [Node(label='node {}'.format(i), weight=i / 3, tags=[i, 'tag'],
+                   meta={'rank': i}) for i in range(count)]
+    for model in models: context.put(model)
+    for i in range(1, count): models[i].parent = models[i // 2]
+    models[0].kids = DataList(models[1:100])
+
+    rate('generic to_record', count,
+         lambda: [generic_record(model) for model in models])
+    records = rate('compiled to_record', count,
+                   lambda: [model.to_record() for model in models])
+
+    for mode, codec in sorted(codecs.items()):
+        def dump():
+            chunks = codec.dump(records, context.name)
+            if codec.binary: return b''.join(chunks)
+            return ''.join(chunks).encode()
+        data = rate('{} encode'.format(mode), count, dump)
+        rate('{} decode'.format(mode), count,
+             lambda: list(codec.load(BytesIO(data))))
+        print('{:<28} {:>12,} bytes'.format(mode + ' size', len(data)))
+
+    copies = [pkas.json.loads(pkas.json.dumps(record)) for record in records]
+    rate('make models', count,
+         lambda: [context._build(record) for record in copies])
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -6,16 +6,34 @@ The module supports three primary features: Recycling of DataModels and
 DataWidgets, views for displaying DataCollections, and a control system
 which delegates to Interactive Widgets.
 
+class PoolStats(object):
 class Factory(object):
 factory = Factory() # Singleton
 def specify(Ctor, stack_length=STACK_LEN):
+def apply_batch(obj, kwargs):
 
 class DataModel(EventDispatcher):
+class RecordMeta(type):
+class Record(metaclass=RecordMeta):
 class DataCollection(DataModel):
 class DataList(DataCollection, MutableSequence):
 class DataDeque(DataList):
+class DataSortedList(DataList):
+class TableRow(DataModel):
+class DataTable(DataList):
 class DataDict(DataCollection, MutableMapping):
 class DataSet(DataCollection, MutableSet):
+class PropertyIndex(object):
+class Codec(metaclass=ABCMeta):
+class JsonCodec(Codec):
+class NdjsonCodec(Codec):
+class MarshalCodec(Codec):
+class ZlibCodec(Codec):
+codecs = {} # mode: Codec
+def register_codec(mode, codec):
+class IdAllocator(metaclass=ABCMeta):
+class CounterIds(IdAllocator):
+class LazyModels(dict):
 class FileContext(DataModel, MutableMapping):
 
 class DataProperty(ObjectProperty):
@@ -25,10 +43,15 @@ class DataWidget(Widget):
 class CollectionProperty(ObjectProperty):
 class DataView(Layout):
 class ListView(DataView):
-class DictView(Layout):
-class SetView(Layout):
+class DictView(DataView):
+class SetView(DataView):
 
 class ReducerProperty(CollectionProperty):
+class ReducerStage(object):
+class FilterStage(ReducerStage):
+class MapStage(ReducerStage):
+class SortStage(ReducerStage):
+class LimitStage(ReducerStage):
 class ListReducerView(ListView):
 class DequeReducerView(ListView):
 class DictReducerView(DictView):
@@ -43,38 +66,98 @@ class Walker(EventDispatcher):
 def load_kv(*args):
 """
 
+from abc import ABCMeta, abstractmethod
 from collections import defaultdict, deque, OrderedDict
-from collections.abc import MutableSequence, MutableMapping, MutableSet
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import (Mapping, MutableSequence, MutableMapping,
+                             MutableSet)
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import chain, islice
 import json
-from random import random
+import marshal
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
 from os.path import join
+from time import perf_counter
+from weakref import WeakValueDictionary
 
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.event import EventDispatcher
-from kivy.properties import (AliasProperty, BooleanProperty,
-                            NumericProperty, ObjectProperty,StringProperty)
+from kivy.properties import (AliasProperty, BooleanProperty, DictProperty,
+                            ListProperty, NumericProperty, ObjectProperty,
+                            StringProperty)
 from kivy.lang import Builder
 from kivy.uix.layout import Layout
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.widget import Widget
 from kivy.core.window import Window
 
+try: import numpy
+except ImportError: numpy = None
+
 
 STACK_LEN = 10
+POOL_BUDGET = 5000
+IDLE_INTERVAL = 5.
+IDLE_DECAY = .5
+FRAME_BUDGET = .004
+JOURNAL_LIMIT = 1 << 22
+PARALLEL_LIMIT = 1 << 20 # smallest file load_parallel splits
+PKBIN_HEADER = b'pkas:mode=pkbin\n'
+PKBIN_TRAILER = struct.Struct('<QIH4s') # index offset, count, key width
 LOG = True
 def log(*args):
     if LOG: print(*args)
 
 
 
+class PoolStats(object):
+    '''
+    Counters kept by the Factory for a single class pool. Times are the
+    cumulative seconds spent in reinit() on a reuse and in the class
+    constructor on a miss. Read them through factory.stats().
+    '''
+    __slots__ = ('hits', 'misses', 'recycled', 'dropped', 'evicted',
+                 'depth', 'peak', 'reinit_time', 'ctor_time')
+
+    def __init__(self, depth=0):
+        self.reset(depth)
+
+    def reset(self, depth=0):
+        self.hits = self.misses = self.recycled = 0
+        self.dropped = self.evicted = 0
+        self.depth = self.peak = depth
+        self.reinit_time = self.ctor_time = 0.0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+
 class Factory(object):
     '''
     The Factory maintains an object pool of DataModels and DataWidgets.
     Items to be recycled by the factory must implement both reinit(kwargs)
     and recycle(), which are used by the Factory to setup and teardown
     objects. The Factory maintains a stack for each class, the lengths
-    of which may be set by set_stack_length.
+    of which may be set by set_stack_length. Per class PoolStats are
+    returned by stats() and cleared by reset_stats().
+
+    In adaptive mode (see enable_adaptive) stack lengths are only a floor:
+    pools grow with demand while the total number of pooled objects stays
+    under a global budget, and pools left untouched for a Clock interval
+    are shrunk back towards their floor.
+
+    In deferred mode (see enable_deferred) recycle() only queues objects.
+    The queue is torn down on later Clock frames within a time budget, and
+    make() reuses whatever part of it has already been torn down.
     '''
     _inst = None  #Singleton reference
 
@@ -84,6 +167,15 @@ class Factory(object):
             inst._ctors = {}
             inst._recycled = defaultdict(list)
             inst._stack_lengths = {}
+            inst._stats = defaultdict(PoolStats)
+            inst._pooled = 0
+            inst._active = set()
+            inst._adaptive = None
+            inst._budget = POOL_BUDGET
+            inst._decay = IDLE_DECAY
+            inst._pending = deque()
+            inst._deferred = None
+            inst._frame_budget = FRAME_BUDGET
         return cls._inst
 
 
@@ -97,12 +189,24 @@ class Factory(object):
         except KeyError:
             raise Exception('factory.make:', cls, 'not specified.')
 
-        try:
-            obj = self._recycled[cls].pop().reinit(*args, **kwargs)
+        stats = self._stats[cls]
+        obj_stack = self._recycled[cls]
+        self._active.add(cls)
+        start = perf_counter()
+
+        if obj_stack:
+            self._pooled -= 1
+            obj = obj_stack.pop().reinit(*args, **kwargs)
+            stats.reinit_time += perf_counter() - start
+            stats.hits += 1
+            stats.depth = len(obj_stack)
             log('Factory:\tReused:', obj, kwargs)
             return obj
-        except IndexError:
-            return Ctor(*args, **kwargs)
+
+        obj = Ctor(*args, **kwargs)
+        stats.ctor_time += perf_counter() - start
+        stats.misses += 1
+        return obj
 
 
     def recycle(self, obj):
@@ -111,21 +215,254 @@ class Factory(object):
         into its class' stack awaiting reinitialization. All other
         references to obj should be dropped by this point.
         '''
+        if self._deferred is not None:
+            self._pending.append(obj)
+            self._deferred()
+            return
+
         cls = obj.__class__.__name__
         obj_stack = self._recycled[cls]
+        stats = self._stats[cls]
+        length = self._stack_lengths[cls]
+
+        if self._adaptive is not None:
+            self._active.add(cls)
+            if len(obj_stack) >= length and self._pooled < self._budget:
+                length = len(obj_stack) + 1
 
-        if len(obj_stack) < self._stack_lengths[cls]:
+        if len(obj_stack) < length:
             obj_stack.append(obj.recycle())
+            self._pooled += 1
+            stats.recycled += 1
+            depth = stats.depth = len(obj_stack)
+            if depth > stats.peak: stats.peak = depth
+        else:
+            stats.dropped += 1
 
         log('Factory:\tRecycled:', obj)
 
 
+    def make_many(self, cls, kwargs_iter):
+        '''
+        Returns a list of objects made as by make(cls, **kwargs) for each
+        kwargs dict in kwargs_iter, looking up the class and stack once.
+        '''
+        try: Ctor = self._ctors[cls]
+        except KeyError:
+            raise Exception('factory.make_many:', cls, 'not specified.')
+
+        stats = self._stats[cls]
+        obj_stack = self._recycled[cls]
+        self._active.add(cls)
+        kwargs_list = list(kwargs_iter)
+        reused = min(len(kwargs_list), len(obj_stack))
+        objs = []
+
+        if reused:
+            start = perf_counter()
+            for kwargs in kwargs_list[:reused]:
+                objs.append(obj_stack.pop().reinit(**kwargs))
+            stats.reinit_time += perf_counter() - start
+            stats.hits += reused
+            stats.depth = len(obj_stack)
+            self._pooled -= reused
+
+        if reused < len(kwargs_list):
+            start = perf_counter()
+            for kwargs in kwargs_list[reused:]:
+                objs.append(Ctor(**kwargs))
+            stats.ctor_time += perf_counter() - start
+            stats.misses += len(kwargs_list) - reused
+
+        log('Factory:\tMade:', cls, len(objs), 'reused:', reused)
+        return objs
+
+
+    def recycle_many(self, objs):
+        '''
+        Recycles each of objs as by recycle(obj), looking up the stack of
+        a class once per run of objects of that class.
+        '''
+        if self._deferred is not None:
+            self._pending.extend(objs)
+            self._deferred()
+            return
+
+        adaptive = self._adaptive is not None
+        cls = None
+        count = 0
+
+        for obj in objs:
+            count += 1
+            if obj.__class__.__name__ != cls:
+                cls = obj.__class__.__name__
+                obj_stack = self._recycled[cls]
+                stats = self._stats[cls]
+                length = self._stack_lengths[cls]
+                if adaptive: self._active.add(cls)
+
+            if (len(obj_stack) < length
+                    or adaptive and self._pooled < self._budget):
+                obj_stack.append(obj.recycle())
+                self._pooled += 1
+                stats.recycled += 1
+                depth = stats.depth = len(obj_stack)
+                if depth > stats.peak: stats.peak = depth
+            else:
+                stats.dropped += 1
+
+        log('Factory:\tRecycled:', count)
+
+
+    def prewarm(self, cls, n, per_frame=None):
+        '''
+        Fills the stack of cls with fresh objects until it holds n, raising
+        the stack length of cls to n if it is shorter. With per_frame the
+        objects are built per_frame at a time on successive Clock frames,
+        and the scheduled ClockEvent is returned so it may be cancelled.
+        '''
+        try: Ctor = self._ctors[cls]
+        except KeyError:
+            raise Exception('factory.prewarm:', cls, 'not specified.')
+
+        if self._stack_lengths[cls] < n: self._stack_lengths[cls] = n
+        stats = self._stats[cls]
+        remaining = [n - len(self._recycled[cls])]
+
+        def fill(dt=None):
+            obj_stack = self._recycled[cls]
+            count = remaining[0] if per_frame is None else per_frame
+            count = min(count, remaining[0], n - len(obj_stack))
+            if count <= 0: return False
+
+            start = perf_counter()
+            for i in range(count): obj_stack.append(Ctor())
+            stats.ctor_time += perf_counter() - start
+            self._pooled += count
+            depth = stats.depth = len(obj_stack)
+            if depth > stats.peak: stats.peak = depth
+            remaining[0] -= count
+            log('Factory:\tPrewarmed:', cls, count)
+            return remaining[0] > 0
+
+        if per_frame is None: fill()
+        elif fill(): return Clock.schedule_interval(fill, 0)
+
+
+    def enable_deferred(self, budget=FRAME_BUDGET):
+        '''
+        Queues recycled objects instead of tearing them down at once. The
+        queue is drained on the following Clock frames, spending at most
+        budget seconds per frame in obj.recycle().
+        '''
+        self._frame_budget = budget
+        if self._deferred is None:
+            self._deferred = Clock.create_trigger(self._drain_pending)
+
+
+    def disable_deferred(self):
+        '''Stops queueing and tears down everything still pending.'''
+        if self._deferred is None: return
+        self._deferred.cancel()
+        self._deferred = None
+        self.flush_pending()
+
+
+    def flush_pending(self):
+        '''Synchronously tears down every queued object.'''
+        self._drain_pending(budget=float('inf'))
+
+
+    def _drain_pending(self, dt=None, budget=None):
+        pending = self._pending
+        if not pending: return
+
+        if budget is None: budget = self._frame_budget
+        deadline = perf_counter() + budget
+        deferred, self._deferred = self._deferred, None
+        recycle = self.recycle
+        count = 0
+
+        try:
+            while pending:
+                recycle(pending.popleft())
+                count += 1
+                if perf_counter() > deadline: break
+        finally:
+            self._deferred = deferred
+
+        log('Factory:\tDrained:', count, 'pending:', len(pending))
+        if pending and deferred is not None: deferred()
+
+
     def set_stack_length(self, cls, length):
         self._stack_lengths[cls] = length
         recycled = self._recycled[cls]
 
         if len(recycled) > length:
+            self._pooled -= len(recycled) - length
             self._recycled[cls] = recycled[:length]
+            self._stats[cls].depth = length
+
+
+    def enable_adaptive(self, budget=POOL_BUDGET, interval=IDLE_INTERVAL,
+                        decay=IDLE_DECAY):
+        '''
+        Lets every pool grow past its stack length while fewer than budget
+        objects are pooled in total. Every interval seconds the pools that
+        were neither made from nor recycled to lose decay of their excess.
+        '''
+        self.disable_adaptive(trim=False)
+        self._budget = budget
+        self._decay = decay
+        self._active.clear()
+        self._adaptive = Clock.schedule_interval(self._evict_idle, interval)
+
+
+    def disable_adaptive(self, trim=True):
+        '''Stops adaptive sizing, trimming pools back to their lengths.'''
+        if self._adaptive is None: return
+        self._adaptive.cancel()
+        self._adaptive = None
+        if trim:
+            for cls, length in self._stack_lengths.items():
+                self.set_stack_length(cls, length)
+
+
+    def _evict_idle(self, dt):
+        active = self._active
+        decay = self._decay
+
+        for cls, obj_stack in self._recycled.items():
+            floor = self._stack_lengths.get(cls, 0)
+            depth = len(obj_stack)
+            if cls in active or depth <= floor: continue
+
+            keep = max(floor, int(depth - (depth - floor) * decay))
+            del obj_stack[keep:]
+            self._pooled -= depth - keep
+            stats = self._stats[cls]
+            stats.evicted += depth - keep
+            stats.depth = keep
+            log('Factory:\tEvicted:', cls, depth - keep)
+
+        active.clear()
+
+
+    def stats(self, cls=None):
+        '''
+        Returns the PoolStats counters of the class name cls as a dict, or
+        if cls is None a dict of those dicts keyed by class name.
+        '''
+        if cls is not None: return self._stats[cls].as_dict()
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+    def reset_stats(self, cls=None):
+        '''Zeroes the counters of cls, or of every pool if cls is None.'''
+        names = list(self._stats) if cls is None else [cls]
+        for name in names:
+            self._stats[name].reset(len(self._recycled[name]))
 
 
 
@@ -147,59 +484,401 @@ def specify(Ctor, stack_length=STACK_LEN):
 
 
 
+def apply_batch(obj, kwargs):
+    '''
+    Sets kwargs on obj, setting rebinding properties such as DataProperty
+    last, so the kv rules they trigger see every other value in place.
+    '''
+    late = []
+    for name, value in kwargs.items():
+        prop = obj.property(name, True)
+        if prop is not None and getattr(prop, 'rebind', False):
+            late.append((name, value))
+        else: setattr(obj, name, value)
+
+    for name, value in late:
+        setattr(obj, name, value)
+
+
+
+_reset_plans = {}  # DataModel class -> resettable properties
+_row_classes = {}  # column names and kinds -> TableRow subclass
+_observers = {}  # Record class -> observing DataModel class
+_serializers = {}  # model class -> (record encoder, record decoder)
+
 @specify
 class DataModel(EventDispatcher):
     '''
     Model that supports recycling and save / load by implementing
     recycle(), reinit(...) and to_json(), load(context) respectively.
+
+    The first recycle() resets the properties whose value differs from
+    their default and starts following writes to them. Later recycles
+    reset only the properties written since, so recycling a pooled model
+    costs O(changed properties).
     '''
 
     is_selected = BooleanProperty(False)
     save = []
+    _journal = None # ids of changed models of the FileContext holding it
+    _tracking = False
+    _dirty = None # names of properties written since the last recycle
 
     def __eq__(self, other): return self is other
     def __ne__(self, other): return self is not other
+    __hash__ = EventDispatcher.__hash__
     def __init__(self, _id=None, *args, **kwargs):
+        self._refs = None
         self._id = _id
         super().__init__(*args, **kwargs)
 
+    def _track(self, journal):
+        '''
+        Adds this model's _id to journal, the changed models of a
+        FileContext, when a saved property changes; None stops it.
+        Properties are bound on first use only, so untracked models pay
+        nothing for it.
+        '''
+        self._journal = journal
+        if journal is None or self._tracking: return
+        self._tracking = True
+        for name in self.save:
+            if self.property(name, True) is not None:
+                self.fbind(name, self._mark)
+
+    def _mark(self, *args):
+        journal = self._journal
+        if journal is not None: journal.add(self._id)
+
+    def _compile_reset_plan(self):
+        '''Caches the resettable properties of this class by name.'''
+        plan = _reset_plans[self.__class__] = {
+            name: prop for name, prop in self.properties().items()
+            if not isinstance(prop, AliasProperty)}
+        return plan
+
+    def _written(self, name, *args): self._dirty.add(name)
+
     def recycle(self):
         self._id = None
-        for prop in self.properties().values():
-            prop.set(self, prop.defaultvalue)
+        try: plan = _reset_plans[self.__class__]
+        except KeyError: plan = self._compile_reset_plan()
+
+        dirty = self._dirty
+        if dirty is None:
+            for prop in plan.values():
+                default = prop.defaultvalue
+                if prop.get(self) != default: prop.set(self, default)
+            self._dirty = set()
+            fbind, written = self.fbind, self._written
+            for name in plan: fbind(name, written, name)
+        else:
+            self._dirty = set() # resets dispatch, so they land here
+            for name in dirty:
+                prop = plan[name]
+                prop.set(self, prop.defaultvalue)
         return self
 
     def reinit(self, _id=None, **kwargs):
         self._id = _id
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+        apply_batch(self, kwargs)
         return self
 
     def load(self, context):
-        for prop in self.properties().values():
-            if isinstance(prop, DataProperty):
-                prop.get(self).load(context)
+        '''
+        Sets the models referred to in _refs, as left by the file loader,
+        from context and loads any collections saved within this model.
+        References to models missing from context leave the property unset.
+        '''
+        refs = self._refs
+        if refs is not None:
+            self._refs = None
+            for name, ref in refs.items():
+                if type(ref) is not _Ref: ref = _Ref(ref) # a bare saved _id
+                model = _resolve(ref, context)
+                if model is not ref: setattr(self, name, model)
+        for name in self.save:
+            value = getattr(self, name)
+            if isinstance(value, DataCollection): value.load(context)
+
+    def to_record(self):
+        '''
+        Returns the saved properties as a dict of plain values, copied so
+        it may be serialized away from the main thread.
+        '''
+        try: encode = _serializers[self.__class__][0]
+        except KeyError: encode = self._compile_serializer()[0]
+        return encode(self)
+
+    @classmethod
+    def _compile_serializer(cls):
+        '''
+        Caches an encoder of this class's records, written out for its save
+        list by the kind of each property, and a decoder that makes a model
+        from a record, keeping the _ids of its DataProperties in _refs.
+        '''
+        fields = [(name, _field_kind(getattr(cls, name, None)))
+                  for name in cls.save]
+        refs = tuple(name for name, kind in fields if kind == 'ref')
+        name, make = cls.__name__, factory.make
+
+        def decode(record):
+            held = None
+            for key in refs:
+                value = record.pop(key, None)
+                if value is not None:
+                    if held is None: held = {}
+                    held[key] = value
+            model = make(name, **record)
+            if held: model._refs = held
+            return model
+
+        serializer = _serializers[cls] = (_compile_encoder(cls, fields),
+                                          decode)
+        return serializer
 
     def to_json(self):
-        output = []
-        entries = []
-        output.append('{\n')
-        append = entries.append
-        append('  "__class__" : "{}"'.format(self.__class__.__name__))
-        for prop_name in self.save:
-            value = getattr(self, prop_name)
-            if isinstance(value, DataCollection): value = value.to_json()
-            elif isinstance(value, DataModel): value = value._id
-            append('  "{}" : {}'.format(prop.name, value))
-        output.append(',\n'.join(entries))
-        output.append('  }')
-        return ''.join(output)
+        '''Returns the saved properties as a single line of json.'''
+        return json.dumps(self.to_record(), separators=(',', ':'))
 
     # def __repr__(self):
     #     return '_id:{}'.format(self._id)
 
 
 
+class RecordMeta(type):
+    '''Collects the fields of Record classes and slots the new ones.'''
+
+    def __new__(mcs, name, bases, attrs):
+        fields = {}
+        for base in reversed(bases): fields.update(getattr(base, 'fields', {}))
+        own = attrs.get('fields', {})
+        slots = list(attrs.get('__slots__', ()))
+        slots.extend(field for field in own if field not in fields)
+        fields.update(own)
+        attrs['fields'] = fields
+        attrs['__slots__'] = tuple(slots)
+        return super().__new__(mcs, name, bases, attrs)
+
+
+
+class Record(metaclass=RecordMeta):
+    '''
+    Lightweight model for records that are loaded and saved far more than
+    they are watched. Subclasses declare fields, a dict of names to
+    defaults, which are kept in __slots__ instead of Kivy properties, so
+    defaults should be immutable. Fields named in refs hold other models,
+    saved as their _ids and resolved by load(context). Records are
+    recycled by the factory like DataModels.
+
+    observe() returns a DataModel with a property per field, made on
+    first use and kept in sync with the record in both directions, for
+    the records widgets bind to. Each observe() is matched by an
+    unobserve(), and the observer is dropped after the last. DataProperties
+    given a Record hold its observer until they are set to another value,
+    so a DataWidget's model may be a Record and recycling the widget
+    releases it.
+    '''
+    __slots__ = ('_id', '_observer', '_watchers', '_journal', '__weakref__')
+    fields = {}
+    refs = ()
+
+    def __init__(self, _id=None, **kwargs):
+        set_field = object.__setattr__
+        set_field(self, '_observer', None)
+        set_field(self, '_watchers', 0)
+        set_field(self, '_journal', None)
+        set_field(self, '_id', _id)
+        for name, default in self.fields.items():
+            set_field(self, name, default)
+        for name, value in kwargs.items(): set_field(self, name, value)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.fields:
+            observer = self._observer
+            if observer is not None: setattr(observer, name, value)
+            journal = self._journal
+            if journal is not None: journal.add(self._id)
+
+    def _track(self, journal):
+        object.__setattr__(self, '_journal', journal)
+
+    def observe(self):
+        '''Returns the DataModel observing this record, as one watcher.'''
+        object.__setattr__(self, '_watchers', self._watchers + 1)
+        observer = self._observer
+        if observer is None:
+            try: Observer = _observers[self.__class__]
+            except KeyError: Observer = self._make_observer()
+            values = {name: getattr(self, name) for name in self.fields}
+            observer = Observer(_id=self._id, **values)
+            observer.record = self
+            object.__setattr__(self, '_observer', observer)
+        return observer
+
+    def unobserve(self):
+        '''Releases a watcher, dropping the observer after the last.'''
+        watchers = self._watchers - 1
+        if watchers > 0:
+            object.__setattr__(self, '_watchers', watchers)
+        else: self._drop_observer()
+
+    def _drop_observer(self):
+        observer = self._observer
+        if observer is not None:
+            observer.record = None
+            object.__setattr__(self, '_observer', None)
+        object.__setattr__(self, '_watchers', 0)
+
+    @classmethod
+    def _make_observer(cls):
+        def store(name):
+            def on_field(self, instance, value):
+                record = self.record
+                if record is None: return
+                object.__setattr__(record, name, value)
+                journal = record._journal
+                if journal is not None: journal.add(record._id)
+            return on_field
+
+        attrs = {'record': None}
+        for name, default in cls.fields.items():
+            if isinstance(default, bool): prop = BooleanProperty(default)
+            elif isinstance(default, (int, float)):
+                prop = NumericProperty(default)
+            elif isinstance(default, str): prop = StringProperty(default)
+            else: prop = ObjectProperty(default, allownone=True)
+            attrs[name] = prop
+            attrs['on_{}'.format(name)] = store(name)
+        Observer = _observers[cls] = type(cls.__name__ + 'Observer',
+                                          (DataModel,), attrs)
+        return Observer
+
+    def recycle(self):
+        self._drop_observer()
+        set_field = object.__setattr__
+        set_field(self, '_id', None)
+        for name, default in self.fields.items():
+            set_field(self, name, default)
+        return self
+
+    def reinit(self, _id=None, **kwargs):
+        object.__setattr__(self, '_id', _id)
+        for name, value in kwargs.items(): setattr(self, name, value)
+        return self
+
+    def load(self, context):
+        '''Resolves the _ids held in refs fields to models from context.'''
+        for name in self.refs:
+            value = getattr(self, name)
+            if value is None or isinstance(value, (DataModel, Record)):
+                continue
+            if type(value) is not _Ref: value = _Ref(value) # a bare saved _id
+            setattr(self, name, _resolve(value, context))
+        for name in self.fields:
+            value = getattr(self, name)
+            if isinstance(value, DataCollection): value.load(context)
+
+    def to_record(self):
+        try: encode = _serializers[self.__class__][0]
+        except KeyError: encode = self._compile_serializer()[0]
+        return encode(self)
+
+    @classmethod
+    def _compile_serializer(cls):
+        '''Caches the record encoder and decoder of this class.'''
+        fields = [(name, 'ref' if name in cls.refs else 'plain')
+                  for name in cls.fields]
+        name, make = cls.__name__, factory.make
+        serializer = _serializers[cls] = (_compile_encoder(cls, fields),
+                                          lambda record: make(name, **record))
+        return serializer
+
+    def to_json(self):
+        return json.dumps(self.to_record(), separators=(',', ':'))
+
+
+
+class _Ref(object):
+    '''
+    A reference to a model by _id, made by the file loader from a saved
+    {"__ref__": _id}, which plain data can not be mistaken for. It stands
+    in for the model until resolved, and is saved again if never resolved.
+    '''
+    __slots__ = ('_id',)
+
+    def __init__(self, _id): self._id = _id
+    def __repr__(self): return '_Ref({!r})'.format(self._id)
+
+def _ref(value):
+    '''Returns the reference to a model, to be saved in its place.'''
+    if isinstance(value, (DataModel, Record, _Ref)):
+        return None if value._id is None else {'__ref__': value._id}
+    return value
+
+def _resolve(value, context):
+    '''Returns the model of context a _Ref refers to, else value.'''
+    if type(value) is not _Ref: return value
+    try: return context[value._id]
+    except KeyError: return value
+
+def _resolver(context):
+    '''
+    Returns a function resolving values as _resolve does, looking them up
+    directly in the table of _ids to models held by a FileContext's data.
+    As every model of the file is in the table before any is loaded,
+    forward references and cycles resolve in the same single pass.
+    '''
+    table = getattr(context, 'data', None)
+    if type(table) is not dict: return lambda value: _resolve(value, context)
+    get = table.get
+
+    def resolve(value):
+        if type(value) is not _Ref: return value
+        return get(value._id, value)
+    return resolve
+
+def _plain(value):
+    '''Returns value as saved: models by reference, collections as records.'''
+    if isinstance(value, DataCollection): return value.to_record()
+    if isinstance(value, (DataModel, Record, _Ref)): return _ref(value)
+    if isinstance(value, (list, tuple)): return list(value)
+    if isinstance(value, dict): return dict(value)
+    return value
+
+def _field_kind(prop):
+    '''Returns how _compile_encoder saves the value of property prop.'''
+    if isinstance(prop, DataProperty): return 'ref'
+    if isinstance(prop, ListProperty): return 'list'
+    if isinstance(prop, DictProperty): return 'dict'
+    if isinstance(prop, (StringProperty, NumericProperty, BooleanProperty)):
+        return 'raw'
+    return 'plain'
+
+def _compile_encoder(cls, fields):
+    '''
+    Returns a function making the record of a cls model as a single dict
+    display, fields being (name, kind) pairs as given by _field_kind.
+    '''
+    forms = {'ref': '_ref({})', 'list': 'list({})', 'dict': 'dict({})',
+             'raw': '{}', 'plain': '_plain({})'}
+    items = ["'__class__': {!r}".format(cls.__name__), "'_id': model._id"]
+    for name, kind in fields:
+        if name.isidentifier(): value = 'model.' + name
+        else: value = 'getattr(model, {!r})'.format(name)
+        items.append('{!r}: {}'.format(name, forms[kind].format(value)))
+    source = 'def encode(model):\n    return {{{}}}\n'.format(', '.join(items))
+    namespace = {'_ref': _ref, '_plain': _plain}
+    exec(source, namespace)
+    return namespace['encode']
+
+def _collection_record(collection, data):
+    return {'__class__': collection.__class__.__name__,
+            '_id': collection._id, 'data': data}
+
+
+
 class DataCollection(DataModel):
     '''
     Base Collection class to hold collections of DataModels. The events
@@ -209,21 +888,82 @@ class DataCollection(DataModel):
     The recycle and reinit methods provided here clear and set
     collection.data. If this is undesirable you may wish to call the
     parent DataWidget methods directly while implementing your own.
+
+    Mutations made within batch() are summarized on exit by a single
+    on_batch(events) event, where events is a tuple of (event, args).
+
+    add_index(name) keeps a PropertyIndex of the collection's models by
+    the value of their property name, held in indexes.
     '''
+    def on_batch(self, events): pass
+
     def __init__(self, **kwargs):
+        self._recorded = None
+        self.indexes = {}
         for event in self.events: self.register_event_type(event)
         super().__init__(**kwargs)
 
     def _cast(self, other):
         return other.data if isinstance(other, DataCollection) else other
 
+    def dispatch(self, event_type, *args, **kwargs):
+        journal = self._journal
+        if journal is not None: journal.add(self._id)
+        recorded = self._recorded
+        if recorded is None or event_type == 'on_batch':
+            return super().dispatch(event_type, *args, **kwargs)
+        recorded.append((event_type, args))
+
+    @contextmanager
+    def batch(self):
+        '''
+        Records the events of mutations made within the block instead of
+        dispatching them. On exit of the outermost batch, events made moot
+        by a later on_clear are dropped, an on_update replaces everything
+        since handlers rebuild from the final data, and what remains is
+        dispatched as one on_batch, or as itself if it is a single event.
+        '''
+        if self._recorded is not None:
+            yield self
+            return
+
+        recorded = self._recorded = []
+        try: yield self
+        finally:
+            self._recorded = None
+            events = self._summarize(recorded)
+            if len(events) == 1: self.dispatch(events[0][0], *events[0][1])
+            elif events: self.dispatch('on_batch', tuple(events))
+
+    def _summarize(self, events):
+        for i in reversed(range(len(events))):
+            event = events[i][0]
+            if event == 'on_update': return [events[i]]
+            if event == 'on_clear':
+                for event, args in events[i:]:
+                    if event == 'on_update': return [(event, args)]
+                return events[i:]
+        return events
+
+    def add_index(self, name, ordered=False):
+        '''Returns the PropertyIndex on name, adding it if needed.'''
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = PropertyIndex(self, name, ordered)
+        return index
+
+    def remove_index(self, name):
+        self.indexes.pop(name).detach()
+
     def recycle(self):
+        for index in self.indexes.values(): index.detach()
+        self.indexes.clear()
         self.data.clear()
-        super().recycle()
+        return super().recycle()
 
     def reinit(self, data=None, *args, **kwargs):
-        self.data = data
-        super().reinit(*args, **kwargs)
+        if data is not None: self.data = data
+        return super().reinit(*args, **kwargs)
 
 
 
@@ -232,22 +972,36 @@ class DataCollection(DataModel):
 class DataList(DataCollection, MutableSequence):
     '''
     List implementation of DataCollection.
+    Bulk changes are described by on_splice, where removed items starting
+    at start are replaced by the list added, and on_permute, where order
+    maps each new position to the old position of its item.
+
+    With indexed=True (or enable_index()) the list keeps an identity index
+    of DataModel positions, making index(), remove() and membership tests
+    O(1). Appends, swaps, sets and changes at the ends keep it current;
+    other shifting changes mark it stale until the next lookup rebuilds
+    it. Assigning to .data directly requires a call to reindex().
     '''
-    events = 'on_del','on_set','on_clear','on_insert','on_update','on_swap'
+    events = ('on_del','on_set','on_clear','on_insert','on_update','on_swap',
+              'on_splice','on_permute','on_batch')
     def on_insert(self,i,x): pass
     def on_clear(self): pass
     def on_del(self,i): pass
     def on_set(self,i,x): pass
     def on_update(self): pass
     def on_swap(self,a,b): pass
+    def on_splice(self,start,removed,added): pass
+    def on_permute(self,order): pass
 
-    def __init__(self, data=None, **kwargs):
+    def __init__(self, data=None, indexed=False, **kwargs):
+        self._positions = None
         super().__init__(**kwargs)
         if data is not None:
             if not isinstance(data, MutableSequence):
                 raise TypeError('DataList passed non MutableSequence.', data)
             self.data = data
         else: self.data = []
+        if indexed: self.enable_index()
     def __iter__(self): return iter(self.data)
     def __lt__(self, other): return self.data <  self._cast(other)
     def __le__(self, other): return self.data <= self._cast(other)
@@ -255,14 +1009,41 @@ class DataList(DataCollection, MutableSequence):
     def __ne__(self, other): return self.data != self._cast(other)
     def __gt__(self, other): return self.data >  self._cast(other)
     def __ge__(self, other): return self.data >= self._cast(other)
-    def __contains__(self, item): return item in self.data
+    def __contains__(self, item):
+        if self._positions is None: return item in self.data
+        try: self._position(item)
+        except ValueError: return False
+        return True
     def __len__(self): return len(self.data)
     def __reversed__(self): return reversed(self.data)
     def __getitem__(self, index): return self.data[index]
     def __setitem__(self, index, item):
-        self.data.__setitem__(index, item)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.data))
+            if step == 1:
+                return self.splice(start, max(stop - start, 0), item)
+            self.data[index] = item
+            self._index_shift()
+            return self.dispatch('on_update')
+        if index < 0: index += len(self.data)
+        if self._positions is not None:
+            self._index_discard(self.data[index], index)
+            self._index_add(item, index)
+        self.data[index] = item
         self.dispatch('on_set', index, item)
     def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.data))
+            if step == 1:
+                return self.splice(start, max(stop - start, 0))
+            del self.data[index]
+            self._index_shift()
+            return self.dispatch('on_update')
+        if index < 0: index += len(self.data)
+        if self._positions is not None:
+            if index == len(self.data) - 1:
+                self._index_discard(self.data[index], index)
+            else: self._index_shift()
         del self.data[index]
         self.dispatch('on_del', index)
     def __add__(self, other):
@@ -278,89 +1059,841 @@ class DataList(DataCollection, MutableSequence):
             return self.__class__(other + self.data)
         return self.__class__(list(other) + self.data)
     def __iadd__(self, other):
-        if isinstance(other, DataList):
-            self.data += other.data
-        elif isinstance(other, type(self.data)):
-            self.data += other
-        else:
-            self.data += list(other)
-        self.dispatch('on_update')
+        self.extend(other)
         return self
     def __mul__(self, n):
         return self.__class__(self.data*n)
     def __imul__(self, n):
-        self.data *= n
-        self.dispatch('on_update')
+        length = len(self.data)
+        if n < 1: self.splice(0, length)
+        elif n > 1: self.splice(length, 0, list(self.data) * (n - 1))
         return self
     __rmul__ = __mul__
     def append(self, item):
+        self._index_add(item, len(self.data))
         self.data.append(item)
         self.dispatch('on_insert', len(self)-1, item)
     def clear(self):
         self.data.clear()
+        if self._positions is not None: self.reindex()
         self.dispatch('on_clear')
     def copy(self): return self.__class__(self.data.copy())
     def count(self, item): return self.data.count(item)
     def extend(self, L):
-        self.data.extend(L)
-        self.dispatch('on_update')
+        self.splice(len(self.data), 0, self._cast(L))
     def index(self, item):
-        return self.data.index(item)
+        return self._position(item)
     def insert(self, index, item):
+        length = len(self.data)
+        if index < 0: index = max(index + length, 0)
+        if index >= length:
+            index = length
+            self._index_add(item, index)
+        else: self._index_shift()
         self.data.insert(index, item)
         self.dispatch('on_insert', index, item)
-    def pop(self, index=None):
-        self.data.pop(index)
-        self.dispatch('on_del', index)
-    def remove(self, item):
-        index = self.data.index(item)
+    def pop(self, index=-1):
+        if index < 0: index += len(self.data)
+        item = self.data[index]
         del self[index]
-        self.dispatch('on_del', index)
+        return item
+    def remove(self, item):
+        del self[self.index(item)]
     def reverse(self):
-        self.data.reverse()
-        self.dispatch('on_update')
-    def sort(self, cmp=None, key=None, reverse=False):
-        self.data.sort(cmp, key, reverse)
-        self.dispatch('on_update')
+        self.permute(range(len(self.data) - 1, -1, -1))
+    def sort(self, key=None, reverse=False):
+        data = self.data
+        if key is None: sort_key = data.__getitem__
+        else: sort_key = lambda i: key(data[i])
+        self.permute(sorted(range(len(data)), key=sort_key, reverse=reverse))
     def swap(self, a, b):
         d = self.data
         d[a], d[b] = d[b], d[a]
+        if self._positions is not None and not self._stale:
+            if self._dups: self._stale = True
+            else:
+                positions, offset = self._positions, self._offset
+                positions[id(d[a])] = a + offset
+                positions[id(d[b])] = b + offset
         self.dispatch('on_swap', a, b)
+    def splice(self, start, removed=0, items=()):
+        '''Replaces removed items from start with items, as one event.'''
+        items = list(items)
+        self._index_splice(start, removed, items)
+        self.data[start:start + removed] = items
+        self.dispatch('on_splice', start, removed, items)
+    def permute(self, order):
+        '''Moves the item at order[i] to i for every new position i.'''
+        order = list(order)
+        items = list(self.data)
+        self.data[:] = [items[i] for i in order]
+        self._index_shift()
+        self.dispatch('on_permute', order)
+
+    def match(self, items):
+        '''
+        Edits the list into items, matched by identity, with one batch of
+        few events: runs of missing items are spliced out, the kept items
+        are permuted once if their order changed, and runs of new items are
+        spliced in. Widgets of kept items are thereby moved, not rebuilt.
+        Items are expected to appear at most once.
+        '''
+        target = list(items)
+        wanted = set(map(id, target))
+        keep = [id(item) in wanted for item in self.data]
+
+        with self.batch():
+            end = len(keep)
+            while end:
+                if keep[end - 1]:
+                    end -= 1
+                    continue
+                start = end - 1
+                while start and not keep[start - 1]: start -= 1
+                self.splice(start, end - start)
+                end = start
+
+            kept = list(self.data)
+            present = set(map(id, kept))
+            ordered = [item for item in target if id(item) in present]
+            if any(a is not b for a, b in zip(kept, ordered)):
+                position = {id(item): i for i, item in enumerate(kept)}
+                self.permute([position[id(item)] for item in ordered])
+
+            start, length = 0, len(target)
+            while start < length:
+                if id(target[start]) in present:
+                    start += 1
+                    continue
+                end = start + 1
+                while end < length and id(target[end]) not in present:
+                    end += 1
+                self.splice(start, 0, target[start:end])
+                start = end
+
+    def enable_index(self):
+        '''Starts keeping the identity index of item positions.'''
+        if self._positions is None: self.reindex()
+
+    def disable_index(self):
+        self._positions = None
+
+    def reindex(self):
+        '''Rebuilds the identity index from data.'''
+        data = self.data
+        positions = self._positions = dict(
+            zip(map(id, reversed(data)), range(len(data) - 1, -1, -1)))
+        self._dups = len(positions) != len(data)
+        self._offset = 0
+        self._stale = False
+
+    def _position(self, item):
+        if self._positions is None or not isinstance(item, DataModel):
+            return self.data.index(item)
+        if self._stale: self.reindex()
+        try: return self._positions[id(item)] - self._offset
+        except KeyError:
+            raise ValueError('{} is not in DataList'.format(item)) from None
+
+    def _index_add(self, item, i):
+        '''Records item placed at i without shifting other items.'''
+        positions = self._positions
+        if positions is None or self._stale: return
+        key = id(item)
+        i += self._offset
+        j = positions.get(key)
+        if j is None: positions[key] = i
+        else:
+            self._dups = True
+            if i < j: positions[key] = i
+
+    def _index_discard(self, item, i):
+        '''Records item removed from i without shifting other items.'''
+        if self._positions is None or self._stale: return
+        if self._dups: self._stale = True
+        else: del self._positions[id(item)]
+
+    def _index_shift(self):
+        if self._positions is not None: self._stale = True
+
+    def _index_splice(self, start, removed, items):
+        if self._positions is None or self._stale: return
+        data = self.data
+        if start + removed != len(data):
+            self._stale = True
+            return
+        for i in range(start, start + removed):
+            self._index_discard(data[i], i)
+        for i, item in enumerate(items, start):
+            self._index_add(item, i)
+
+    def recycle(self):
+        self._positions = None
+        return super().recycle()
+
+    def reinit(self, data=None, indexed=False, **kwargs):
+        super().reinit(data, **kwargs)
+        self._positions = None
+        if indexed: self.enable_index()
+        return self
 
     def load(self, context):
-        '''If any data items are still _ids, load the models from context.'''
+        '''Replaces the references left by the file loader with models.'''
         data = self.data
-        for index, item in enumerate(data):
-            if type(item) is str:
-                self.data[index] = context[item]
+        items = list(map(_resolver(context), data))
+        data.clear()
+        data.extend(items)
+        if self._positions is not None: self.reindex()
 
-    def to_json(self):
-        ent = []
-        out = []
-        out.append('{')
-        ent.append('"__class__":"{}"'.format(self.__class__.__name__))
-        ent.append('"data":"[{}]"'.format(','.join(i._id for i in self.data)))
-        out.append(','.join(ent))
-        out.append('}')
-        return ''.join(out)
+    def to_record(self):
+        return _collection_record(self, [_ref(item) for item in self.data])
 
 
 
 @specify
 class DataDeque(DataList):
+    '''
+    Deque implementation of DataList. With a maxlen the deque is bounded:
+    appending to a full deque evicts from the opposite end in O(1), which
+    is dispatched as a single on_roll(x, left) event, left being True when
+    x entered at the left end. roll() does the same for any deque.
+    '''
+    events = DataList.events + ('on_roll',)
+    def on_roll(self,x,left): pass
 
-    def __init__(self, data=None, **kwargs):
-        if data is not None: data = deque(data)
-        else: data = deque()
-        super().__init__(data)
+    def __init__(self, data=None, maxlen=None, **kwargs):
+        super().__init__(deque(data or (), maxlen), **kwargs)
+
+    @property
+    def maxlen(self): return self.data.maxlen
+
+    def _full(self):
+        maxlen = self.data.maxlen
+        return maxlen is not None and len(self.data) >= maxlen
+
+    def append(self, x):
+        if self._full(): self.roll(x)
+        else: super().append(x)
+
+    def extend(self, L):
+        maxlen = self.data.maxlen
+        if maxlen is None: return super().extend(L)
+        items = list(self._cast(L))[-maxlen:] if maxlen else []
+        free = maxlen - len(self.data)
+        with self.batch():
+            if free: super().extend(items[:free])
+            for x in items[free:]: self.roll(x)
+
+    def insert(self, index, item):
+        if self._full(): raise IndexError('DataDeque already at its maxlen')
+        super().insert(index, item)
+
+    def roll(self, x, left=False):
+        '''
+        Adds x at one end and evicts the item at the other, returning it.
+        Views can reuse the evicted item's widget for x.
+        '''
+        data = self.data
+        if not data: return None
+        indexed = self._positions is not None
+        if left:
+            evicted = data.pop()
+            self._index_discard(evicted, len(data))
+            data.appendleft(x)
+            if indexed: self._offset -= 1
+            self._index_add(x, 0)
+        else:
+            evicted = data.popleft()
+            self._index_discard(evicted, 0)
+            if indexed: self._offset += 1
+            data.append(x)
+            self._index_add(x, len(data) - 1)
+        self.dispatch('on_roll', x, left)
+        return evicted
 
     def appendleft(self, x):
+        if self._full(): return self.roll(x, True)
         self.data.appendleft(x)
+        if self._positions is not None:
+            self._offset -= 1
+            self._index_add(x, 0)
         self.dispatch('on_insert', 0, x)
 
+    def reinit(self, data=None, maxlen=None, **kwargs):
+        if data is not None or maxlen != self.data.maxlen:
+            data = deque(data or (), maxlen)
+        return super().reinit(data, **kwargs)
+
+    def to_record(self):
+        record = super().to_record()
+        record['maxlen'] = self.data.maxlen
+        return record
+
     def popleft(self):
-        self.data.popleft()
+        item = self.data.popleft()
+        if self._positions is not None:
+            self._index_discard(item, 0)
+            self._offset += 1
         self.dispatch('on_del', 0)
+        return item
+
+    def __delitem__(self, index):
+        if index == 0 or index == -len(self.data): self.popleft()
+        else: super().__delitem__(index)
+
+    def splice(self, start, removed=0, items=()):
+        items = list(items)
+        data = self.data
+        if (data.maxlen is not None and
+                len(data) - removed + len(items) > data.maxlen):
+            raise IndexError('DataDeque already at its maxlen')
+        self._index_splice(start, removed, items)
+        data.rotate(-start)
+        for i in range(removed): data.popleft()
+        data.extendleft(reversed(items))
+        data.rotate(start)
+        self.dispatch('on_splice', start, removed, items)
+
+    def permute(self, order):
+        order = list(order)
+        items = list(self.data)
+        self.data.clear()
+        self.data.extend(items[i] for i in order)
+        self._index_shift()
+        self.dispatch('on_permute', order)
+
+
+
+@specify
+class DataSortedList(DataList):
+    '''
+    DataList kept in order by key(item), stably for equal keys. Binary
+    search places add()ed items and finds them for index(), remove() and
+    membership, and changes go out as positional on_insert and on_del
+    events, so a ListView places or recycles a single widget per change.
+    Positional writes (insert, item assignment, swap, reverse, permute
+    and splices that add items) raise TypeError.
+
+    With key_property the key defaults to that property of each model,
+    and a model whose key property changes is moved to its new position,
+    as an on_del and on_insert pair. Such models are expected to appear
+    at most once. A key changed by other means requires a call to sort().
+
+    key_property is saved with the items; a key function is not. Items
+    loaded from a file are sorted by load(), once their references are
+    resolved, and references to models missing from the file are dropped.
+    '''
+    def __init__(self, data=None, key=None, key_property=None, **kwargs):
+        self._keys = []
+        self._watched = {}
+        super().__init__(**kwargs)
+        self._set_key(key, key_property)
+        if data is not None: self._rebuild(data)
+
+    def __contains__(self, item):
+        try: self.index(item)
+        except ValueError: return False
+        return True
+    def __setitem__(self, index, item): self._unordered()
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.data))
+            if step == 1: return self.splice(start, max(stop - start, 0))
+            for item in self.data[index]: self._unwatch(item)
+            del self._keys[index]
+            return super().__delitem__(index)
+        if index < 0: index += len(self.data)
+        self._unwatch(self.data[index])
+        del self._keys[index]
+        super().__delitem__(index)
+    def __add__(self, other):
+        result = self.copy()
+        result.extend(other)
+        return result
+    __radd__ = __add__
+    def __mul__(self, n):
+        return self._new(self.data * n)
+    __rmul__ = __mul__
+    def __imul__(self, n):
+        if n < 1: self.clear()
+        elif n > 1: self.extend(list(self.data) * (n - 1))
+        return self
+
+    def add(self, item):
+        '''Inserts item after any items of equal key.'''
+        key = self._keyfunc(item)
+        i = bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self.data.insert(i, item)
+        self._watch(item, key)
+        self.dispatch('on_insert', i, item)
+    append = add
+    def clear(self):
+        for item in self.data: self._unwatch(item)
+        self._keys.clear()
+        super().clear()
+    def copy(self): return self._new(self.data)
+    def count(self, item):
+        lo, hi = self._span(item)
+        return sum(1 for x in islice(self.data, lo, hi) if x == item)
+    def extend(self, L):
+        with self.batch():
+            for item in list(self._cast(L)): self.add(item)
+    def index(self, item):
+        lo, hi = self._span(item)
+        data = self.data
+        for i in range(lo, hi):
+            if data[i] is item: return i
+        for i in range(lo, hi):
+            if data[i] == item: return i
+        raise ValueError('{} is not in DataSortedList'.format(item))
+    def insert(self, index, item): self._unordered()
+    def reverse(self): self._unordered()
+    def swap(self, a, b): self._unordered()
+    def permute(self, order): self._unordered()
+    def splice(self, start, removed=0, items=()):
+        if items: self._unordered()
+        for item in self.data[start:start + removed]: self._unwatch(item)
+        del self._keys[start:start + removed]
+        super().splice(start, removed)
+    def sort(self, key=None):
+        '''
+        Re-sorts by freshly computed keys, or by a new key function, with
+        one on_permute event if the order changed.
+        '''
+        if key is not None: self._set_key(key, self.key_property)
+        data, keyfunc = self.data, self._keyfunc
+        keys = [keyfunc(item) for item in data]
+        order = sorted(range(len(data)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in order]
+        if self._watched is not None:
+            for item, k in zip(data, keys): self._watched[id(item)] = k
+        if order != list(range(len(data))): DataList.permute(self, order)
+
+    def _unordered(self):
+        raise TypeError('DataSortedList places items by key, use add().')
+
+    def _new(self, data):
+        return self.__class__(data, key=self.key,
+                              key_property=self.key_property)
+
+    def _set_key(self, key, key_property):
+        self.key = key
+        self.key_property = key_property
+        if key is not None: self._keyfunc = key
+        elif key_property is not None:
+            self._keyfunc = lambda item: getattr(item, key_property)
+        else: self._keyfunc = lambda item: item
+        self._watched = {} if key_property is not None else None
+
+    def _rebuild(self, data):
+        '''Silently replaces data with the sorted items of data.'''
+        for item in self.data: self._unwatch(item)
+        data = list(data)
+        if any(type(item) is _Ref for item in data):
+            # the file loader's references are sorted by load()
+            self._keys = []
+            self.data = data
+            return
+        keyfunc = self._keyfunc
+        entries = sorted(((keyfunc(item), item) for item in data),
+                         key=lambda entry: entry[0])
+        self._keys = [k for k, item in entries]
+        self.data = [item for k, item in entries]
+        for k, item in entries: self._watch(item, k)
+
+    def _span(self, item):
+        watched = self._watched
+        if watched is not None and id(item) in watched:
+            key = watched[id(item)]
+        else:
+            try: key = self._keyfunc(item)
+            except (AttributeError, TypeError): return 0, 0
+        keys = self._keys
+        try: return bisect_left(keys, key), bisect_right(keys, key)
+        except TypeError: return 0, 0
+
+    def _watch(self, item, key):
+        if self._watched is None or not isinstance(item, DataModel): return
+        self._watched[id(item)] = key
+        item.fbind(self.key_property, self._rekey)
+
+    def _unwatch(self, item):
+        if self._watched is None or not isinstance(item, DataModel): return
+        self._watched.pop(id(item), None)
+        item.funbind(self.key_property, self._rekey)
+
+    def _rekey(self, model, value):
+        i = self.index(model)
+        key = self._keyfunc(model)
+        keys, data = self._keys, self.data
+        del keys[i]
+        del data[i]
+        j = bisect_right(keys, key)
+        keys.insert(j, key)
+        data.insert(j, model)
+        self._watched[id(model)] = key
+        if i != j:
+            with self.batch():
+                self.dispatch('on_del', i)
+                self.dispatch('on_insert', j, model)
+
+    def recycle(self):
+        for item in self.data: self._unwatch(item)
+        self._keys = []
+        return super().recycle()
+
+    def reinit(self, data=None, key=None, key_property=None, **kwargs):
+        super().reinit(**kwargs)
+        self._set_key(key, key_property)
+        if data is not None: self._rebuild(data)
+        return self
+
+    def load(self, context):
+        '''Replaces the loader's references with models, sorting them.'''
+        items = map(_resolver(context), self.data)
+        self._rebuild([item for item in items if type(item) is not _Ref])
+        if self._positions is not None: self.reindex()
+
+    def to_record(self):
+        record = super().to_record()
+        record['key_property'] = self.key_property
+        return record
+
+
+
+class TableRow(DataModel):
+    '''
+    Proxy for one row of a DataTable, made on demand by the table and
+    shared while referenced. Subclasses made by the table hold a property
+    per column; writes to them are stored back into the columns. row is
+    the row's position, or None once the row is removed.
+    '''
+    columns = ()
+
+    def __init__(self, table=None, row=None, **kwargs):
+        self._table = None
+        self.row = row
+        super().__init__(**kwargs)
+        for name in self.columns: self.fbind(name, self._store, name)
+        self._table = table
+        if table is not None: self.pull()
+
+    def pull(self):
+        '''Reads the row's values from the table's columns.'''
+        table, self._table = self._table, None
+        try:
+            for name in self.columns:
+                setattr(self, name, table.get_value(self.row, name))
+        finally: self._table = table
+
+    def _store(self, name, model, value):
+        table = self._table
+        if table is not None and self.row is not None:
+            table._columns[name][self.row] = value
+
+    def _detach(self):
+        self._table = None
+        self.row = None
+
+
+
+@specify
+class DataTable(DataList):
+    '''
+    DataList of rows stored as one NumPy array per column, for many rows
+    of numeric fields. Rows are handed out as TableRow proxies, made on
+    demand and shared while referenced, so only rows in use, such as
+    those shown by widgets, cost a DataModel. Rows are given as
+    TableRows, mappings of column names or sequences in column order.
+    The list events carry proxies as items, so ListViews work unchanged.
+
+    columns maps column names to dtypes, or is a sequence of names of
+    the default dtype. column(), where(), argsort() and rows() work on
+    whole columns at once: where() and argsort() return index arrays,
+    which a ListReducerView query can return to select and order rows.
+    Writes made with set_value() and set_column() notify views; writes
+    into column() arrays do not. data may also map column names to their
+    values, the form a saved table is loaded from. Requires numpy.
+    '''
+    __eq__ = DataModel.__eq__
+    __ne__ = DataModel.__ne__
+    __lt__ = object.__lt__
+    __le__ = object.__le__
+    __gt__ = object.__gt__
+    __ge__ = object.__ge__
+
+    def __init__(self, columns=(), dtype=float, data=None, **kwargs):
+        if numpy is None: raise ImportError('DataTable requires numpy.')
+        self._positions = None
+        self._proxies = WeakValueDictionary()
+        self._len = 0
+        DataCollection.__init__(self, **kwargs)
+        self._set_columns(columns, dtype)
+        self.data = self
+        if isinstance(data, Mapping): self._set_rows(data)
+        elif data is not None: self._write(0, 0, data)
+
+    def __len__(self): return self._len
+    def __iter__(self):
+        row = self._row
+        for i in range(self._len): yield row(i)
+    def __reversed__(self):
+        row = self._row
+        for i in range(self._len - 1, -1, -1): yield row(i)
+    def __contains__(self, item):
+        return (isinstance(item, TableRow) and item._table is self and
+                item.row is not None)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(self._len))]
+        return self._row(self._check(index))
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step == 1:
+                return self.splice(start, max(stop - start, 0), item)
+            with self.batch():
+                for i, x in zip(range(start, stop, step), list(item)):
+                    self[i] = x
+            return
+        index = self._check(index)
+        values = self._values(item)
+        for arr, value in zip(self._columns.values(), values):
+            arr[index] = value
+        self._pull(index)
+        self.dispatch('on_set', index, self._row(index))
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step == 1: return self.splice(start, max(stop - start, 0))
+            with self.batch():
+                for i in sorted(range(start, stop, step), reverse=True):
+                    del self[i]
+            return
+        index = self._check(index)
+        self._write(index, 1, ())
+        self.dispatch('on_del', index)
+    def __add__(self, other):
+        result = self.copy()
+        result.extend(other)
+        return result
+    def __radd__(self, other):
+        result = self.copy()
+        result.splice(0, 0, other)
+        return result
+    def __mul__(self, n):
+        result = self.copy()
+        result *= n
+        return result
+    __rmul__ = __mul__
+
+    def append(self, item): self.insert(self._len, item)
+    def clear(self):
+        self._write(0, self._len, ())
+        self.dispatch('on_clear')
+    def copy(self):
+        table = self.__class__(self.dtypes())
+        n = self._len
+        table._reserve(n)
+        table._len = n
+        for name, arr in self._columns.items():
+            table._columns[name][:n] = arr[:n]
+        return table
+    def count(self, item): return 1 if item in self else 0
+    def index(self, item):
+        if item in self: return item.row
+        raise ValueError('{} is not in DataTable'.format(item))
+    def insert(self, index, item):
+        n = self._len
+        if index < 0: index = max(index + n, 0)
+        index = min(index, n)
+        self._write(index, 0, (item,))
+        self.dispatch('on_insert', index, self._row(index))
+    def sort(self, key=None, reverse=False):
+        '''Sorts by a column name with numpy, or by a key of the rows.'''
+        if isinstance(key, str): self.permute(self.argsort(key, reverse))
+        else: super().sort(key, reverse)
+    def swap(self, a, b):
+        for arr in self._columns.values(): arr[[a, b]] = arr[[b, a]]
+        proxies = self._proxies
+        pa, pb = proxies.pop(a, None), proxies.pop(b, None)
+        if pa is not None: pa.row, proxies[b] = b, pa
+        if pb is not None: pb.row, proxies[a] = a, pb
+        self.dispatch('on_swap', a, b)
+    def splice(self, start, removed=0, items=()):
+        '''Replaces removed rows from start with items, as one event.'''
+        items = list(items)
+        self._write(start, removed, items)
+        added = [self._row(i) for i in range(start, start + len(items))]
+        self.dispatch('on_splice', start, removed, added)
+    def permute(self, order):
+        '''Moves the row at order[i] to i for every new position i.'''
+        order = numpy.asarray(order, dtype=numpy.intp)
+        n = self._len
+        for arr in self._columns.values(): arr[:n] = arr[order]
+        moved = numpy.empty(n, dtype=numpy.intp)
+        moved[order] = numpy.arange(n)
+        proxies = self._proxies
+        live = list(proxies.items())
+        proxies.clear()
+        for i, proxy in live:
+            proxy.row = i = int(moved[i])
+            proxies[i] = proxy
+        self.dispatch('on_permute', order.tolist())
+
+    def dtypes(self):
+        return {name: arr.dtype for name, arr in self._columns.items()}
+
+    def column(self, name):
+        '''Returns the array of a column's values, a view to be read.'''
+        return self._columns[name][:self._len]
+
+    def where(self, mask):
+        '''Returns the positions where mask, as from column(), is true.'''
+        return numpy.flatnonzero(mask)
+
+    def argsort(self, name, reverse=False, rows=None):
+        '''
+        Returns positions ordered by the values of a column, stably, of
+        all rows or of the positions in rows.
+        '''
+        values = self.column(name)
+        if rows is None:
+            order = numpy.argsort(values, kind='stable')
+        else:
+            rows = numpy.asarray(rows, dtype=numpy.intp)
+            order = rows[numpy.argsort(values[rows], kind='stable')]
+        return order[::-1] if reverse else order
+
+    def rows(self, positions):
+        '''Returns the TableRows at positions.'''
+        row = self._row
+        return [row(int(i)) for i in positions]
+
+    def get_value(self, index, name):
+        return self._columns[name][index].item()
+
+    def set_value(self, index, name, value):
+        index = self._check(index)
+        self._columns[name][index] = value
+        self._pull(index)
+        self.dispatch('on_set', index, self._row(index))
+
+    def set_column(self, name, values):
+        '''Replaces a column's values, dispatching on_update.'''
+        self._columns[name][:self._len] = values
+        for i in list(self._proxies.keys()): self._pull(i)
+        self.dispatch('on_update')
+
+    def _check(self, index):
+        index = int(index)
+        if index < 0: index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('DataTable index out of range')
+        return index
+
+    def _set_columns(self, columns, dtype):
+        if not isinstance(columns, Mapping):
+            columns = {name: dtype for name in columns}
+        self._columns = {name: numpy.empty(0, dtype)
+                         for name, dtype in columns.items()}
+        self.row_class = self._make_row_class()
+
+    def _make_row_class(self):
+        key = tuple((name, arr.dtype.kind)
+                    for name, arr in self._columns.items())
+        row_class = _row_classes.get(key)
+        if row_class is None:
+            attrs = {'columns': tuple(self._columns)}
+            for name, kind in key:
+                if kind == 'b': attrs[name] = BooleanProperty(False)
+                elif kind in 'iuf': attrs[name] = NumericProperty(0)
+                else: attrs[name] = ObjectProperty(None, allownone=True)
+            row_class = _row_classes[key] = type('TableRow', (TableRow,),
+                                                 attrs)
+        return row_class
+
+    def _row(self, i):
+        proxy = self._proxies.get(i)
+        if proxy is None:
+            proxy = self._proxies[i] = self.row_class(self, i)
+        return proxy
+
+    def _pull(self, i):
+        proxy = self._proxies.get(i)
+        if proxy is not None: proxy.pull()
+
+    def _values(self, item):
+        if isinstance(item, TableRow):
+            return [getattr(item, name) for name in self._columns]
+        if isinstance(item, Mapping):
+            return [item[name] for name in self._columns]
+        return list(item)
+
+    def _set_rows(self, values):
+        '''Replaces the rows with values, a mapping of column values.'''
+        self._write(0, self._len, ())
+        n = len(next(iter(values.values()), ()))
+        self._reserve(n)
+        for name, arr in self._columns.items(): arr[:n] = values[name]
+        self._len = n
+
+    def _reserve(self, n):
+        columns = self._columns
+        for name, arr in columns.items():
+            if len(arr) < n:
+                grown = numpy.empty(max(n, 2 * len(arr), 8), arr.dtype)
+                grown[:self._len] = arr[:self._len]
+                columns[name] = grown
+
+    def _write(self, start, removed, items):
+        '''Replaces removed rows from start with items, silently.'''
+        values = [self._values(item) for item in items]
+        added, n = len(values), self._len
+        end = n - removed + added
+        self._reserve(end)
+        for c, arr in enumerate(self._columns.values()):
+            arr[start + added:end] = arr[start + removed:n]
+            if added: arr[start:start + added] = [v[c] for v in values]
+        self._len = end
+
+        shift = added - removed
+        proxies = self._proxies
+        moved = [(i, proxy) for i, proxy in list(proxies.items())
+                 if i >= start]
+        for i, proxy in moved: del proxies[i]
+        for i, proxy in moved:
+            if i < start + removed: proxy._detach()
+            else:
+                proxy.row = i + shift
+                proxies[i + shift] = proxy
+
+    def recycle(self):
+        for index in self.indexes.values(): index.detach()
+        self.indexes.clear()
+        self._write(0, self._len, ())
+        return DataModel.recycle(self)
+
+    def reinit(self, columns=None, dtype=float, data=None, **kwargs):
+        DataModel.reinit(self, **kwargs)
+        if columns is not None:
+            self._write(0, self._len, ())
+            self._set_columns(columns, dtype)
+        if isinstance(data, Mapping): self._set_rows(data)
+        elif data is not None: self._write(0, self._len, data)
+        return self
+
+    def load(self, context):
+        '''Rows hold values, not references, so there is nothing to load.'''
+
+    def to_record(self):
+        columns = self._columns
+        record = _collection_record(
+            self, {name: self.column(name).tolist() for name in columns})
+        record['columns'] = {name: arr.dtype.str
+                             for name, arr in columns.items()}
+        return record
 
 
 
@@ -370,8 +1903,8 @@ class DataDict(DataCollection, MutableMapping):
     Dict implementation of DataCollection.
     Supports DataCollection event interface and file loading.
     '''
-    events = 'on_del','on_set','on_clear','on_update'
-    def on_del(self,k,v): pass
+    events = 'on_del','on_set','on_clear','on_update','on_batch'
+    def on_del(self,k): pass
     def on_set(self,k,v): pass
     def on_clear(self): pass
     def on_update(self): pass
@@ -383,8 +1916,8 @@ class DataDict(DataCollection, MutableMapping):
         else:
             data = dict()
             props = self.properties()
-            for kw in kwargs:
-                if kw not in props: data[kw] = kwargs.pop(kw)
+            for kw in list(kwargs):
+                if kw not in props and kw != '_id': data[kw] = kwargs.pop(kw)
 
         super().__init__(**kwargs)
         self.data = data
@@ -419,7 +1952,8 @@ class DataDict(DataCollection, MutableMapping):
     def keys(self): return self.data.keys()
     def values(self): return self.data.values()
     def setdefault(self, key, default=None):
-        self.data.setdefault(key, default)
+        if key not in self.data: self[key] = default
+        return self.data[key]
 
     def pop(self, key):
         item = self.data.pop(key)
@@ -427,7 +1961,7 @@ class DataDict(DataCollection, MutableMapping):
         return item
 
     def popitem(self):
-        key, item = self.data.pop(key)
+        key, item = self.data.popitem()
         self.dispatch('on_del', key)
         return key, item
 
@@ -436,29 +1970,21 @@ class DataDict(DataCollection, MutableMapping):
         self.dispatch('on_update')
 
     def load(self, context):
-        '''If any data items are still _ids, load the models from context.'''
+        '''Replaces the references left by the file loader with models.'''
         data = self.data
-        for key, value in data:
-            if type(value) is str:
-                self.data[key] = context[value]
+        resolve = _resolver(context)
+        for key, value in data.items():
+            data[key] = resolve(value)
 
-    def to_json(self):
-        output = []
-        entries = []
-        output.append('{')
-        entries.append('"__class__":"{}"'.format(self.__class__.__name__))
-        data = []
-        for key, value in self.data:
-            data.append('"{}":"{}"'.format(key, value._id))
-        entries.append('"data":{{}}'.format(','.join(entries)))
-        output.append(','.join(entries))
-        output.append('}')
-        return ''.join(output)
+    def to_record(self):
+        return _collection_record(
+            self, {key: _ref(value) for key, value in self.data.items()})
 
 
 
+@specify
 class DataSet(DataCollection, MutableSet):
-    events = 'on_discard','on_add','on_clear','on_update'
+    events = 'on_discard','on_add','on_clear','on_update','on_batch'
     def on_discard(self,x): pass
     def on_add(self,x): pass
     def on_clear(self): pass
@@ -466,6 +1992,7 @@ class DataSet(DataCollection, MutableSet):
 
     def __init__(self, data=None, **kwargs):
         if data is not None:
+            if isinstance(data, list): data = set(data) # as loaded from json
             if not isinstance(data, MutableSet):
                 raise TypeError('DataSet passed non MutableSet.', data)
         else:
@@ -474,7 +2001,7 @@ class DataSet(DataCollection, MutableSet):
         super().__init__(**kwargs)
         self.data = data
 
-    def __contains__(self, item): return self.data.contains(item)
+    def __contains__(self, item): return item in self.data
     def __iter__(self): return iter(self.data)
     def __len__(self): return len(self.data)
     def __le__(self, other): return self.data <= self._cast(other)
@@ -519,22 +2046,587 @@ class DataSet(DataCollection, MutableSet):
         self.dispatch('on_discard', item)
 
     def load(self, context):
-        '''If any data items are still _ids, load the models from context.'''
+        '''Replaces the references left by the file loader with models.'''
         data = self.data
-        for item in data:
-            if type(item) is str:
-                data.remove(item)
-                data.add(context[item])
+        items = list(map(_resolver(context), data))
+        data.clear()
+        data.update(items)
+
+    def to_record(self):
+        return _collection_record(self, [_ref(item) for item in self.data])
+
+
+
+class PropertyIndex(object):
+    '''
+    Secondary index of the DataModels in a collection by the value of
+    their property name. Membership follows the collection's events, and
+    values follow bindings to the property, so lookup(value) is a dict
+    access returning a live DataSet of the models holding value, fit to
+    be the data of a SetView or SetReducerView. With ordered=True the
+    distinct values are kept sorted as well, and range(lo, hi) costs
+    O(log n) plus the size of its result. A value's DataSet is held while
+    it has models, and after that only as long as a lookup() result is.
+    Made by collection.add_index(name, ordered). Assigning to the
+    collection's data directly requires a call to rebuild().
+    '''
+
+    def __init__(self, collection, name, ordered=False):
+        self.collection = collection
+        self.name = name
+        self.ordered = ordered
+        self._buckets = {} # value: non-empty DataSet
+        self._handed = WeakValueDictionary() # value: DataSet from lookup
+        self._entries = {} # id(model): [model, value, occurrences]
+        self._sorted = [] if ordered else None
+        self._mirror = None
+
+        fbind = collection.fbind
+        self._uids = [fbind(event, self._on_event, event)
+                      for event in collection.events]
+        self.rebuild()
+
+    def __len__(self): return len(self._entries)
+
+    def lookup(self, value):
+        '''Returns the DataSet of models whose property equals value.'''
+        bucket = self._buckets.get(value)
+        if bucket is None: bucket = self._handed.get(value)
+        if bucket is None: bucket = factory.make('DataSet')
+        self._handed[value] = bucket
+        return bucket
+
+    def count(self, value):
+        bucket = self._buckets.get(value)
+        return 0 if bucket is None else len(bucket)
+
+    def values(self):
+        '''Returns the distinct values held, sorted if ordered.'''
+        if self._sorted is not None: return list(self._sorted)
+        return list(self._buckets)
+
+    def range(self, lo=None, hi=None):
+        '''Returns the models with lo <= value < hi, by value.'''
+        keys = self._sorted
+        if keys is None:
+            raise ValueError('PropertyIndex on {} is not ordered.'.format(
+                             self.name))
+        start = 0 if lo is None else bisect_left(keys, lo)
+        stop = len(keys) if hi is None else bisect_left(keys, hi)
+        buckets = self._buckets
+        return [model for value in keys[start:stop]
+                for model in buckets[value]]
+
+    def rebuild(self):
+        '''Re-reads the models of the collection.'''
+        self._clear()
+        data = self.collection.data
+        if isinstance(data, MutableMapping):
+            mirror = dict(data)
+            models = mirror.values()
+        elif isinstance(data, MutableSet): models = mirror = set(data)
+        else: models = mirror = list(data)
+        self._mirror = mirror
+        add = self._add
+        for model in models: add(model)
+
+    def detach(self):
+        '''Stops following the collection and empties the index.'''
+        collection = self.collection
+        unbind_uid = collection.unbind_uid
+        for event, uid in zip(collection.events, self._uids):
+            unbind_uid(event, uid)
+        self._uids = []
+        self._clear()
+        self._mirror = None
+
+    def _clear(self):
+        name, on_value = self.name, self._on_value
+        for model, value, n in self._entries.values():
+            model.funbind(name, on_value)
+        self._entries.clear()
+        handed = self._handed
+        for value, bucket in self._buckets.items():
+            if value in handed: bucket.clear()
+            else: factory.recycle(bucket)
+        self._buckets.clear()
+        if self._sorted is not None: self._sorted.clear()
+
+    def _add(self, model):
+        if not isinstance(model, DataModel): return
+        entry = self._entries.get(id(model))
+        if entry is not None:
+            entry[2] += 1
+            return
+        value = getattr(model, self.name)
+        self._entries[id(model)] = [model, value, 1]
+        model.fbind(self.name, self._on_value)
+        self._file(model, value)
+
+    def _remove(self, model):
+        entry = self._entries.get(id(model))
+        if entry is None: return
+        entry[2] -= 1
+        if entry[2]: return
+        del self._entries[id(model)]
+        model.funbind(self.name, self._on_value)
+        self._unfile(model, entry[1])
+
+    def _file(self, model, value):
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            bucket = self._handed.get(value)
+            if bucket is None: bucket = factory.make('DataSet')
+            self._buckets[value] = bucket
+            if self._sorted is not None: insort(self._sorted, value)
+        bucket.add(model)
+
+    def _unfile(self, model, value):
+        bucket = self._buckets[value]
+        bucket.discard(model)
+        if bucket: return
+        del self._buckets[value]
+        if value not in self._handed: factory.recycle(bucket)
+        if self._sorted is not None:
+            keys = self._sorted
+            del keys[bisect_left(keys, value)]
+
+    def _on_value(self, model, value):
+        entry = self._entries[id(model)]
+        if entry[1] == value: return
+        self._unfile(model, entry[1])
+        entry[1] = value
+        self._file(model, value)
+
+    def _on_event(self, event, collection, *args):
+        mirror = self._mirror
+        add, remove = self._add, self._remove
+
+        if event == 'on_batch':
+            for event, args in args[0]:
+                self._on_event(event, collection, *args)
+            return
+
+        if isinstance(mirror, dict):
+            if event == 'on_set':
+                key, model = args
+                if key in mirror: remove(mirror[key])
+                mirror[key] = model
+                return add(model)
+            if event == 'on_del': return remove(mirror.pop(args[0]))
+
+        elif isinstance(mirror, set):
+            model = args[0] if args else None
+            if event == 'on_add':
+                if model not in mirror:
+                    mirror.add(model)
+                    add(model)
+                return
+            if event == 'on_discard':
+                if model in mirror:
+                    mirror.discard(model)
+                    remove(model)
+                return
+
+        elif event == 'on_insert':
+            i, model = args
+            mirror.insert(i, model)
+            return add(model)
+        elif event == 'on_del': return remove(mirror.pop(args[0]))
+        elif event == 'on_set':
+            i, model = args
+            remove(mirror[i])
+            mirror[i] = model
+            return add(model)
+        elif event == 'on_splice':
+            start, removed, added = args
+            for model in mirror[start:start + removed]: remove(model)
+            mirror[start:start + removed] = added
+            for model in added: add(model)
+            return
+        elif event == 'on_roll':
+            model, left = args
+            if left:
+                remove(mirror.pop())
+                mirror.insert(0, model)
+            else:
+                remove(mirror.pop(0))
+                mirror.append(model)
+            return add(model)
+        elif event == 'on_swap':
+            a, b = args
+            mirror[a], mirror[b] = mirror[b], mirror[a]
+            return
+        elif event == 'on_permute':
+            mirror[:] = [mirror[i] for i in args[0]]
+            return
+
+        self.rebuild()
+
+
+
+class Codec(metaclass=ABCMeta):
+    '''
+    Encodes and decodes the records of a FileContext's models for a mode.
+    dump(records, name) yields the chunks of a file, bytes if binary else
+    str, as it consumes the records. load(f) yields the records read from
+    the binary file f: first {'name': name}, then a record per model, and
+    {'__delete__': _id} for a model deleted since.
+    '''
+    binary = False
+
+    @abstractmethod
+    def dump(self, records, name): pass
+
+    @abstractmethod
+    def load(self, f): pass
+
+
+
+class JsonCodec(Codec):
+    '''A json object of the records by _id, and the name.'''
+
+    def dump(self, records, name):
+        dumps = json.dumps
+        yield '{\n'
+        for record in records:
+            yield '{} : {},\n'.format(dumps(str(record['_id'])),
+                                       dumps(record, separators=(',', ':')))
+        yield '"name" : {}\n}}\n'.format(dumps(name))
+
+    def load(self, f):
+        document = json.load(f)
+        yield {'name': document.pop('name', None)}
+        for key, record in document.items():
+            if record.get('_id') is None: record['_id'] = key
+            yield record
+
+
+
+class NdjsonCodec(Codec):
+    '''A line of json for the name, then for each record.'''
+
+    def dump(self, records, name):
+        dumps = json.dumps
+        yield dumps({'name': name}) + '\n'
+        for record in records:
+            yield dumps(record, separators=(',', ':')) + '\n'
+
+    def load(self, f):
+        loads = json.loads
+        for line in f:
+            if line.strip(): yield loads(line)
+
+
+
+class MarshalCodec(Codec):
+    '''
+    Frames of marshalled lists of records, batch records to a frame, each
+    frame preceded by its length. Records hold only builtin types, so
+    marshal, which is not meant for untrusted files, encodes them compactly
+    and faster than json.
+    '''
+    binary = True
+    frame = struct.Struct('<I')
+
+    def __init__(self, batch=1024):
+        self.batch = batch
+
+    def dump(self, records, name):
+        dumps, pack = marshal.dumps, self.frame.pack
+        records = iter(records)
+        batch = [{'name': name}]
+        while batch:
+            data = dumps(batch, 4)
+            yield pack(len(data)) + data
+            batch = list(islice(records, self.batch))
+
+    def load(self, f):
+        loads, unpack, size = marshal.loads, self.frame.unpack, self.frame.size
+        while True:
+            head = f.read(size)
+            if len(head) < size: return
+            yield from loads(f.read(unpack(head)[0]))
+
+
+
+class ZlibCodec(Codec):
+    '''Compresses the chunks of a binary codec with zlib.'''
+    binary = True
+
+    def __init__(self, codec, level=6):
+        self.codec = codec
+        self.level = level
+
+    def dump(self, records, name):
+        compressor = zlib.compressobj(self.level)
+        for chunk in self.codec.dump(records, name):
+            chunk = compressor.compress(chunk)
+            if chunk: yield chunk
+        yield compressor.flush()
+
+    def load(self, f):
+        return self.codec.load(_Inflated(f))
+
+
+
+class _Inflated(object):
+    '''Reads a zlib stream from f as decompressed bytes.'''
+
+    def __init__(self, f):
+        self._f = f
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def read(self, n=-1):
+        buffer = self._buffer
+        while n < 0 or len(buffer) < n:
+            chunk = self._f.read(1 << 16)
+            if not chunk:
+                buffer += self._decompressor.flush()
+                break
+            buffer += self._decompressor.decompress(chunk)
+        if n < 0: n = len(buffer)
+        data = bytes(buffer[:n])
+        del buffer[:n]
+        return data
+
+    def tell(self): return self._f.tell()
+    def close(self): self._f.close()
+
+
+
+codecs = {}
+def register_codec(mode, codec):
+    '''Registers codec for the FileContexts saved and loaded in mode.'''
+    codecs[mode] = codec
+
+register_codec('json', JsonCodec())
+register_codec('ndjson', NdjsonCodec())
+register_codec('marshal', MarshalCodec())
+register_codec('marshal.zlib', ZlibCodec(MarshalCodec()))
+
+
+class IdAllocator(metaclass=ABCMeta):
+    '''
+    Makes the _ids of the models put in a FileContext without one.
+    observe(_id) is given the _ids of models added or loaded, so they are
+    not made again.
+    '''
+
+    @abstractmethod
+    def allocate(self, context): pass
+
+    def observe(self, _id): pass
 
-    def to_json(self):
-        ent = []
-        out = []
-        out.append('{')
-        ent.append('"__class__":"{}"'.format(self.__class__.__name__))
-        ent.append('"data":"{{}}"'.format(','.join(i._id for i in self.data)))
-        out.append(','.join(ent))
-        out.append('}')
-        return ''.join(out)
+
+
+class CounterIds(IdAllocator):
+    '''
+    Counts up from start, making _ids as base 36 strings, which stay
+    short and are the same key in every file format. The count moves past
+    any such _id observed, and skips those already in the context.
+    '''
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+    def __init__(self, start=0):
+        self.count = start
+
+    def allocate(self, context):
+        while True:
+            _id = self.encode(self.count)
+            self.count += 1
+            if _id not in context: return _id
+
+    def observe(self, _id):
+        if not isinstance(_id, str) or not _id.isalnum(): return
+        try: n = int(_id, 36)
+        except ValueError: return
+        if n >= self.count: self.count = n + 1
+
+    @classmethod
+    def encode(cls, n):
+        digits = cls.digits
+        _id = ''
+        while True:
+            n, digit = divmod(n, 36)
+            _id = digits[digit] + _id
+            if not n: return _id
+
+
+
+def _read_range(path, mode, start, end):
+    '''
+    Returns the records the codec of mode loads from bytes start to end of
+    path, for FileContext.load_parallel's worker processes.
+    '''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return list(codecs[mode].load(BytesIO(data)))
+
+
+
+class LazyModels(dict):
+    '''
+    The data of a FileContext loaded from a pkbin file. The file is memory
+    mapped, and a model is made from its record the first time its _id is
+    looked up, then loaded against the context. Models it refers to are
+    made as they are resolved, breadth first, so a lookup makes only the
+    models reachable from the one asked for.
+
+    The file ends with an index of the records' json encoded _ids, padded
+    on the left to a fixed width and sorted, so lookups are a binary search
+    of the map and the highest CounterIds _id comes last.
+    Iterating, values() and items() cover the models yet to be made, and
+    make them. Instances compare by identity, as their contents differ
+    from what has been made so far.
+    '''
+    def __eq__(self, other): return self is other
+    def __ne__(self, other): return self is not other
+    __hash__ = None
+
+    def __init__(self, context, path):
+        super().__init__()
+        self._context = context
+        self._deleted = set()
+        self._pending = deque()
+        self._loading = False
+        self._map = None
+        self.open(path)
+
+    def open(self, path):
+        '''Maps the file at path, for the models yet to be made.'''
+        self.close()
+        with open(path, 'rb') as f:
+            self._map = m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (self._index, self._count, self._width,
+         magic) = PKBIN_TRAILER.unpack_from(m, len(m) - PKBIN_TRAILER.size)
+        if magic != b'pkbn': raise ValueError('Not a pkbin file: ' + path)
+        self._entry = struct.Struct('<{}sQI'.format(self._width))
+        # _ids of the file made or deleted, to count the rest without a scan
+        self._made = {key for key in chain(dict.__iter__(self), self._deleted)
+                      if self._find(key) is not None}
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _find(self, key):
+        '''Returns the offset and length of the record of key, or None.'''
+        try: key = json.dumps(key).encode()
+        except TypeError: return None
+        width = self._width
+        if len(key) > width: return None
+        key = key.rjust(width)
+        m, entry, start = self._map, self._entry, self._index
+        size = entry.size
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe, offset, length = entry.unpack_from(m, start + mid * size)
+            if probe < key: lo = mid + 1
+            elif probe > key: hi = mid
+            else: return offset, length
+        return None
+
+    def last_id(self):
+        '''Returns the _id last in the file's index, or None.'''
+        if not self._count: return None
+        entry = self._entry
+        offset = self._index + (self._count - 1) * entry.size
+        return json.loads(entry.unpack_from(self._map, offset)[0])
+
+    def _entries(self):
+        '''Yields the _id, offset and length of the file's records.'''
+        m, entry, start = self._map, self._entry, self._index
+        for i in range(self._count):
+            key, offset, length = entry.unpack_from(m, start + i * entry.size)
+            yield json.loads(key), offset, length
+
+    def raw(self, key):
+        '''Returns the saved json of key, or None if it is not saved.'''
+        found = self._find(key)
+        if found is None: return None
+        offset, length = found
+        return self._map[offset:offset + length]
+
+    def records(self):
+        '''
+        Returns the records to save: to_record() of the models made, and
+        (_id, json) of those saved and yet to be made.
+        '''
+        records = [model.to_record() for model in dict.values(self)]
+        m, made = self._map, self._made
+        for key, offset, length in self._entries():
+            if key not in made:
+                records.append((key, m[offset:offset + length]))
+        return records
+
+    def __missing__(self, key):
+        if key in self._deleted: raise KeyError(key)
+        raw = self.raw(key)
+        if raw is None: raise KeyError(key)
+        context = self._context
+        model = json.loads(raw, object_hook=context._make)
+        model._track(context._changed)
+        dict.__setitem__(self, key, model)
+        self._made.add(key)
+        pending = self._pending
+        pending.append(model)
+        if not self._loading:
+            self._loading = True
+            try:
+                while pending: pending.popleft().load(context)
+            finally:
+                self._loading = False
+        return model
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key): return True
+        return key not in self._deleted and self._find(key) is not None
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        if self._find(key) is not None: self._made.add(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def pop(self, key, *default):
+        try: model = self[key]
+        except KeyError:
+            if default: return default[0]
+            raise
+        self._deleted.add(key)
+        return dict.pop(self, key)
+
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+
+    def __iter__(self):
+        yield from dict.__iter__(self)
+        for key, _, _ in self._entries():
+            if key not in self._made: yield key
+
+    def __len__(self):
+        return dict.__len__(self) + self._count - len(self._made)
+
+    def keys(self): return list(self)
+    def values(self): return [self[key] for key in list(self)]
+    def items(self): return [(key, self[key]) for key in list(self)]
+
+
+
+def _temp_path(path):
+    '''
+    Returns a temporary path beside path for one writer, unique to the
+    process and thread, so writers running at once never share one.
+    '''
+    return '{}.{}-{}.tmp'.format(path, os.getpid(), threading.get_ident())
 
 
 
@@ -545,16 +2637,66 @@ class FileContext(DataModel, MutableMapping):
 
     Objects are stored by a unique key that is added as an attribute when
     the model is added to the context. This key remains with the object
-    through saving.
+    through saving. Keys are made by allocator, an IdAllocator, by default
+    CounterIds, which is shown the keys of the models loaded.
+
+    The mode is written as the file's header, and names the Codec
+    registered for it, or the save_{mode} and load_{mode} methods of
+    modes built on the file itself. The json and ndjson codecs are
+    text, the marshal codec is a faster and smaller binary format, and
+    marshal.zlib compresses it. Loading streams the records, optionally
+    per_frame models per Clock frame, dispatching on_progress(count,
+    fraction) as models are added to data. on_loaded is dispatched once
+    references between the models have been resolved.
+
+    In journal mode the file is an ndjson snapshot, and save() appends
+    only the models changed, added or deleted since the last save to
+    filename.journal, which load() replays. Models are marked changed
+    by changes to their saved properties, collection events, put() and
+    touch(); a change to a saved attribute that is not a property needs
+    touch(). Models deleted before they were first saved are left out of
+    the journal. Once the
+    journal exceeds journal_limit bytes it is merged into the snapshot
+    by compact(), on a background thread working on the files alone.
+
+    save_async() and load_async() keep file work off the main thread.
+    save_async() takes records of the models on the main thread, then
+    serializes and writes them on a worker thread to a temporary file
+    that replaces filename. load_async() parses on a worker thread, then
+    makes the models on the main thread, per_frame at a time. Both report
+    on_progress, and on_saved or on_loaded, or on_error(error), through
+    the Clock.
+
+    In pkbin mode the file is a binary container of json records with an
+    index by _id. Loading maps the file and sets data to LazyModels, which
+    makes each model when it is first looked up, so opening takes the same
+    time whatever the size of the file. Saving copies the records of the
+    models not yet made from the old file.
     '''
 
     name = StringProperty('default')
     filename = StringProperty('')
     data = ObjectProperty(None, baseclass=dict)
 
-
-    def __init__(self, mode='json', **kwargs):
+    def on_progress(self, count, fraction): pass
+    def on_loaded(self): pass
+    def on_saved(self): pass
+    def on_error(self, error): pass
+
+    def __init__(self, mode='json', allocator=None, **kwargs):
+        for event in ('on_progress', 'on_loaded', 'on_saved', 'on_error'):
+            self.register_event_type(event)
+        self.allocator = allocator or CounterIds()
+        self._changed = set()
+        self._deleted = set()
+        self._added = set() # ids put since the last save
+        self._compactor = None
+        self._saver = None
+        self._loader = None
+        self._save_again = False
+        self.journal_limit = JOURNAL_LIMIT
         super().__init__(**kwargs)
+        if self.data is None: self.data = {}
         self.mode = mode
 
     # def __repr__(self):
@@ -562,58 +2704,543 @@ class FileContext(DataModel, MutableMapping):
     def __len__(self): return len(self.data)
     def __iter__(self): return iter(self.data)
     def __contains__(self, key): return key in self.data
-    def __delitem__(self, key): del self.data[key]
-    def __setitem__(self, key, value): self.data[key] = value
+    def __delitem__(self, key):
+        self.data.pop(key)._track(None)
+        self._changed.discard(key)
+        if key in self._added: self._added.discard(key)
+        else: self._deleted.add(key)
+    def __setitem__(self, key, value):
+        if key not in self._deleted and key not in self.data:
+            self._added.add(key)
+        self.data[key] = value
+        self.allocator.observe(key)
+        value._track(self._changed)
+        self._changed.add(key)
+        self._deleted.discard(key)
     def __getitem__(self, key): return self.data[key]
     def get(self, key): return self.data[key]
-    def delete(self, key): del self.data[key]
+    def delete(self, key): del self[key]
     def put(self, value):
-        try: _id = value._id
-        except AttributeError: _id = value._id = self._get_id()
-        else:
-            if _id in self.data: raise ValueError('ID already in File')
-        self.data[_id] = value
+        _id = getattr(value, '_id', None)
+        if _id is None: _id = value._id = self._get_id()
+        elif _id in self.data: raise ValueError('ID already in File')
+        self[_id] = value
+    def touch(self, model):
+        '''Marks model as changed, to be saved by a journal save.'''
+        self._changed.add(model._id)
 
 
     def _get_id(self):
-        for i in range(3):
-            _id = random()
-            try: self[_id]
-            except KeyError:
-                return _id
-
-        raise Exception('Did not create unique _id after 3 tries!')
+        return self.allocator.allocate(self)
 
 
     def save(self):
-        '''Iterate over keys, items.to_{mode}() and write to self.filename'''
+        '''
+        Saves with save_{mode}() if defined, else writes the models to
+        self.filename with the codec of the mode.
+        '''
         log('Saving:', self)
+        save_mode = getattr(self, 'save_{}'.format(self.mode), None)
+        if save_mode is not None: save_mode()
+        else:
+            codec = codecs[self.mode]
+            records = (model.to_record() for model in self.data.values())
+            self._write(self.filename, self.mode,
+                        codec.dump(records, self.name), codec.binary)
+        self._changed.clear()
+        self._deleted.clear()
+        self._added.clear()
+
+
+    @staticmethod
+    def _write(path, mode, chunks, binary=False):
+        '''Writes the file to a temporary file, then replaces path.'''
+        tmp = _temp_path(path)
+        try:
+            with open(tmp, 'wb' if binary else 'w') as f:
+                header = 'pkas:mode={}\n'.format(mode)
+                f.write(header.encode() if binary else header)
+                for output in chunks:
+                    f.write(output)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+
+    def save_async(self):
+        '''
+        Saves on a worker thread from records taken now. A save asked for
+        while one runs is made once it completes.
+        '''
+        if self._saver is not None and self._saver.is_alive():
+            self._save_again = True
+            return
+        log('Saving async:', self)
+        changed, deleted = set(self._changed), set(self._deleted)
+        added = set(self._added)
+        self._changed.clear()
+        self._deleted.clear()
+        self._added.clear()
+
+        data = self.data
+        append = (self.mode == 'journal' and os.path.exists(self.filename))
+        if append:
+            records = [data[_id].to_record() for _id in changed if _id in data]
+            records.extend({'__delete__': _id} for _id in deleted)
+        elif self.mode == 'pkbin' and isinstance(data, LazyModels):
+            records = data.records()
+        else: records = [model.to_record() for model in data.values()]
+        path, mode, name = self.filename, self.mode, self.name
+        journals = self._journal_paths()
+        if mode == 'pkbin': dump, binary = self._format_pkbin, True
+        else:
+            codec = codecs['ndjson' if mode == 'journal' else mode]
+            dump, binary = codec.dump, codec.binary
+        total = len(records) or 1
+
+        def counted(records):
+            for count, record in enumerate(records):
+                if count and not count % 1000:
+                    Clock.schedule_once(lambda dt, count=count: self.dispatch(
+                        'on_progress', count, count / total))
+                yield record
+
+        def work():
+            try:
+                chunks = dump(counted(records), name)
+                if append:
+                    with open(journals[1], 'a') as f: f.writelines(chunks)
+                else:
+                    if mode == 'journal':
+                        for journal in journals:
+                            if os.path.exists(journal): os.remove(journal)
+                    self._write(path, mode, chunks, binary)
+            except Exception as error:
+                def failed(dt, error=error):
+                    self._changed.update(changed)
+                    self._deleted.update(deleted)
+                    data = self.data
+                    self._added.update(_id for _id in added if _id in data)
+                    self._finish_save('on_error', error)
+                Clock.schedule_once(failed)
+            else:
+                Clock.schedule_once(lambda dt: self._finish_save('on_saved'))
+
+        self._saver = threading.Thread(target=work, daemon=True)
+        self._saver.start()
+
+
+    def _finish_save(self, event, *args):
+        if (event == 'on_saved' and self.mode == 'pkbin' and
+                isinstance(self.data, LazyModels)):
+            self.data.open(self.filename)
+        self.dispatch(event, *args)
+        journal = self._journal_paths()[1]
+        if (self.mode == 'journal' and os.path.exists(journal) and
+                os.path.getsize(journal) > self.journal_limit):
+            self.compact()
+        if self._save_again:
+            self._save_again = False
+            self.save_async()
+
+
+    @staticmethod
+    def _format_pkbin(records, name):
+        '''
+        Yields the records, each a record or (_id, json), then the index of
+        their offsets sorted by _id, then the trailer locating the index.
+        '''
+        dumps = json.dumps
+        line = (dumps({'name': name}) + '\n').encode()
+        yield line
+        offset = len(PKBIN_HEADER) + len(line)
+        entries = []
+        for record in records:
+            if isinstance(record, tuple): _id, raw = record
+            else:
+                _id = record['_id']
+                raw = dumps(record, separators=(',', ':')).encode()
+            entries.append((dumps(_id).encode(), offset, len(raw)))
+            yield raw
+            yield b'\n'
+            offset += len(raw) + 1
+        width = max((len(key) for key, _, _ in entries), default=0)
+        entry = struct.Struct('<{}sQI'.format(width))
+        entries = sorted((key.rjust(width), start, length)
+                         for key, start, length in entries)
+        yield b''.join(entry.pack(*item) for item in entries)
+        yield PKBIN_TRAILER.pack(offset, len(entries), width, b'pkbn')
+
+
+    def load_parallel(self, workers=None, per_frame=None):
+        '''
+        Splits an ndjson, journal or marshal file into byte ranges decoded
+        by workers processes, then makes the models from the records on
+        the main thread, per_frame at a time, and resolves references
+        between them in one pass. Falls back to load() for other modes,
+        small files and platforms that can not fork.
+        '''
+        path = self.filename
+        with open(path, 'rb') as f:
+            header = f.readline()
+            mode = 'json'
+            if header.startswith(b'pkas:mode='):
+                mode = header[len(b'pkas:mode='):].decode().strip()
+            start, size = f.tell(), os.fstat(f.fileno()).st_size
+            workers = workers or os.cpu_count() or 1
+            if (mode not in ('ndjson', 'journal', 'marshal') or workers < 2
+                    or size < PARALLEL_LIMIT or
+                    'fork' not in multiprocessing.get_all_start_methods()):
+                return self.load(per_frame)
+            if mode == 'marshal': bounds = self._frame_bounds(f, workers)
+            else: bounds = self._line_bounds(f, workers)
+        log('Loading in parallel:', self, len(bounds) - 1)
+
+        codec_mode = 'ndjson' if mode == 'journal' else mode
+        count = len(bounds) - 1
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(workers, context) as pool:
+            parts = list(pool.map(_read_range, [path] * count,
+                                  [codec_mode] * count,
+                                  bounds[:-1], bounds[1:]))
+        if mode == 'journal':
+            for journal in self._journal_paths():
+                if os.path.exists(journal):
+                    with open(journal, 'rb') as f:
+                        parts.append(list(codecs['ndjson'].load(f)))
+
+        records, name = {}, None
+        for part in parts:
+            for record in part:
+                if '__class__' in record: records[record['_id']] = record
+                elif '__delete__' in record:
+                    records.pop(record['__delete__'], None)
+                else: name = record.get('name', name)
+        self._apply_records(mode, name, list(records.values()), per_frame)
+
+
+    @staticmethod
+    def _line_bounds(f, count):
+        '''Returns offsets splitting the rest of f into ranges of lines.'''
+        start, size = f.tell(), os.fstat(f.fileno()).st_size
+        bounds = [start]
+        for i in range(1, count):
+            f.seek(max(start + (size - start) * i // count, bounds[-1]))
+            f.readline()
+            if f.tell() > bounds[-1]: bounds.append(f.tell())
+        if bounds[-1] < size: bounds.append(size)
+        return bounds
+
+
+    @staticmethod
+    def _frame_bounds(f, count):
+        '''Returns offsets splitting the rest of f into ranges of frames.'''
+        frame = MarshalCodec.frame
+        start, size = f.tell(), os.fstat(f.fileno()).st_size
+        step = (size - start) / count
+        bounds, offset = [start], start
+        while True:
+            head = f.read(frame.size)
+            if len(head) < frame.size: break
+            offset += frame.size + frame.unpack(head)[0]
+            f.seek(offset)
+            if offset - bounds[-1] >= step: bounds.append(offset)
+        if bounds[-1] < offset: bounds.append(offset)
+        return bounds
+
+
+    def load_async(self, per_frame=None):
+        '''
+        Parses filename into records on a worker thread, then makes the
+        models from them on the main thread, per_frame at a time.
+        '''
+        log('Loading async:', self)
+        path = self.filename
+        journals = self._journal_paths()
+
+        def work():
+            try: result = self._read_records(path, journals)
+            except Exception as error:
+                Clock.schedule_once(lambda dt, error=error:
+                                    self.dispatch('on_error', error))
+            else: Clock.schedule_once(lambda dt: self._apply_records(
+                                      *result, per_frame=per_frame))
+
+        self._loader = threading.Thread(target=work, daemon=True)
+        self._loader.start()
+
+
+    @staticmethod
+    def _read_records(path, journals):
+        '''Returns the mode, name and model records of a file.'''
+        with open(path, 'rb') as f:
+            header = f.readline()
+            if header.startswith(b'pkas:mode='):
+                mode = header[len(b'pkas:mode='):].decode().strip()
+            else:
+                mode = 'json'
+                f.seek(0)
+        if mode == 'pkbin': return mode, None, None # opened lazily
+
+        codec = codecs['ndjson' if mode == 'journal' else mode]
+        sources = [path]
+        if mode == 'journal':
+            sources.extend(path for path in journals if os.path.exists(path))
+        records, name = {}, None
+        for i, source in enumerate(sources):
+            with open(source, 'rb') as f:
+                if i or header.startswith(b'pkas:mode='): f.readline()
+                for record in codec.load(f):
+                    if '__class__' in record: records[record['_id']] = record
+                    elif '__delete__' in record:
+                        records.pop(record['__delete__'], None)
+                    else: name = record.get('name', name)
+        return mode, name, list(records.values())
+
+
+    def _apply_records(self, mode, name, records, per_frame=None):
+        if records is None: return self.load()
+        self.mode = mode
+        if name is not None: self.name = name
+        self.data = {}
+        data = self.data
+        records = deque(records)
+        total = len(records) or 1
+        build = self._build
+
+        def apply(dt=None):
+            for i in range(per_frame or len(records)):
+                if not records: break
+                model = build(records.popleft())
+                data[model._id] = model
+            if not records:
+                self._loaded()
+                return False
+            self.dispatch('on_progress', len(data), len(data) / total)
+            return True
+
+        if per_frame: Clock.schedule_interval(apply, 0)
+        else: apply()
+
+
+    def _build(self, value):
+        '''Makes the models a parsed record describes, innermost first.'''
+        if isinstance(value, dict):
+            return self._make({key: self._build(item)
+                               for key, item in value.items()})
+        if isinstance(value, list):
+            return [self._build(item) for item in value]
+        return value
+
+
+    def save_pkbin(self):
+        '''
+        Writes the models as a pkbin file, copying the records of those
+        not yet made from the file loaded, which is then mapped anew.
+        '''
+        data = self.data
+        if isinstance(data, LazyModels): records = data.records()
+        else: records = [model.to_record() for model in data.values()]
+        self._write(self.filename, self.mode,
+                    self._format_pkbin(records, self.name), binary=True)
+        if isinstance(data, LazyModels): data.open(self.filename)
+
+
+    def save_journal(self):
+        '''Appends the changes since the last save to the journal.'''
+        if not os.path.exists(self.filename):
+            for path in self._journal_paths():
+                if os.path.exists(path): os.remove(path)
+            return self._write(self.filename, self.mode, self.to_ndjson())
+
+        data = self.data
+        lines = [json.dumps({'name': self.name}) + '\n']
+        for _id in self._changed:
+            model = data.get(_id)
+            if model is not None: lines.append(model.to_json() + '\n')
+        for _id in self._deleted:
+            lines.append(json.dumps({'__delete__': _id}) + '\n')
+
+        journal = self._journal_paths()[1]
+        with open(journal, 'a') as f: f.writelines(lines)
+        if os.path.getsize(journal) > self.journal_limit: self.compact()
 
-        with open(self.filename, 'w') as f:
-            f.write('pkas:mode={}\n'.format(self.mode))
-            for output in getattr(self, 'to_{}'.format(self.mode))():
-                f.write(output)
+
+    def compact(self):
+        '''
+        Merges the journal into the snapshot on a background thread. The
+        journal is first moved aside, so saves can go on meanwhile.
+        '''
+        if self._compactor is not None and self._compactor.is_alive(): return
+        pending, journal = self._journal_paths()
+        if not os.path.exists(pending):
+            if not os.path.exists(journal): return
+            os.replace(journal, pending)
+        self._compactor = threading.Thread(
+            target=self._compact, args=(self.filename, pending), daemon=True)
+        self._compactor.start()
+
+
+    @staticmethod
+    def _compact(path, pending):
+        loads = json.loads
+        entries, name = {}, None
+        with open(pending, 'rb') as f:
+            for line in f:
+                if not line.strip(): continue
+                item = loads(line)
+                if '__delete__' in item: entries[item['__delete__']] = None
+                elif '__class__' in item: entries[item['_id']] = line
+                else: name = line
+
+        tmp = _temp_path(path)
+        try:
+            with open(path, 'rb') as src, open(tmp, 'wb') as out:
+                out.write(src.readline())
+                for line in src:
+                    if not line.strip(): continue
+                    item = loads(line)
+                    if '__class__' not in item: line = name or line
+                    elif item['_id'] in entries:
+                        line = entries.pop(item['_id'])
+                        if line is None: continue
+                    out.write(line)
+                out.writelines(line for line in entries.values() if line)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        os.remove(pending)
+
+
+    def _journal_paths(self):
+        journal = self.filename + '.journal'
+        return journal + '.compacting', journal
 
 
     def to_json(self):
-        yield ('{\n')
-        for _id, model in self.data.items():
-            yield ('"{}" : {},\n'.format(_id, getattr(model, 'to_json')()))
-        yield ('"name" : "{}"\n'.format(self.name))
-        yield ('}\n')
+        records = (model.to_record() for model in self.data.values())
+        return codecs['json'].dump(records, self.name)
 
 
-    def load(self):
-        '''Parse filename as json, update self and call load() on items.'''
-        make = self.factory.make
-        with open(self.filename, 'r') as f:
-            data = json.load(file = f, object_hook = lambda d:
-                make(d.pop('__class__'), **d) if '__class__' in d else d)
+    def to_ndjson(self):
+        records = (model.to_record() for model in self.data.values())
+        return codecs['ndjson'].dump(records, self.name)
 
-        self.name = data.pop('name')
-        self.data = data
-        for model in data.values():
+
+    def load(self, per_frame=None):
+        '''
+        Reads filename with load_{mode} if defined, else the codec of the
+        mode given by its header. Returns the Clock event of a load spread
+        over frames, if any.
+        '''
+        log('Loading:', self)
+        f = open(self.filename, 'rb')
+        header = f.readline()
+        if header.startswith(b'pkas:mode='):
+            self.mode = header[len(b'pkas:mode='):].decode().strip()
+        else:
+            self.mode = 'json'
+            f.seek(0)
+        load_mode = getattr(self, 'load_{}'.format(self.mode), None)
+        if load_mode is not None: return load_mode(f, per_frame)
+        return self._stream([f], codecs[self.mode], per_frame)
+
+
+    def load_pkbin(self, f, per_frame=None):
+        '''Maps the file, to make each model when first looked up.'''
+        with f: name = json.loads(f.readline()).get('name')
+        if name is not None: self.name = name
+        self.data = LazyModels(self, self.filename)
+        self.allocator.observe(self.data.last_id())
+        self._loaded()
+
+
+    def load_journal(self, f, per_frame=None):
+        '''Reads the snapshot f as ndjson, then replays the journal.'''
+        files = [f]
+        for path in self._journal_paths():
+            if os.path.exists(path): files.append(open(path, 'rb'))
+        return self._stream(files, codecs['ndjson'], per_frame)
+
+
+    def _stream(self, files, codec, per_frame):
+        '''Makes the models of the records codec loads from files.'''
+        self.data = {}
+        data = self.data
+        size = sum(os.fstat(f.fileno()).st_size for f in files) or 1
+        files = deque(files)
+        build = self._build
+        records = None
+        read_size = 0
+
+        def read(dt=None):
+            nonlocal read_size, records
+            limit = per_frame
+            while files:
+                if records is None: records = codec.load(files[0])
+                record = next(records, None)
+                if record is None:
+                    f = files.popleft()
+                    read_size += os.fstat(f.fileno()).st_size
+                    f.close()
+                    records = None
+                    continue
+                if '__class__' in record:
+                    model = build(record)
+                    data[model._id] = model
+                elif '__delete__' in record:
+                    data.pop(record['__delete__'], None)
+                else: self.name = record.get('name', self.name)
+                if limit:
+                    limit -= 1
+                    if not limit: break
+
+            if not files:
+                self._loaded()
+                return False
+            fraction = (read_size + files[0].tell()) / size
+            self.dispatch('on_progress', len(data), fraction)
+            return True
+
+        if per_frame: return Clock.schedule_interval(read, 0)
+        read()
+
+
+    def _make(self, d):
+        '''
+        Makes the model a json object describes, or the _Ref of a saved
+        reference, keeping the references held by DataProperties in _refs
+        until load(context).
+        '''
+        name = d.pop('__class__', None)
+        if name is None:
+            if len(d) == 1 and '__ref__' in d: return _Ref(d['__ref__'])
+            return d
+        Ctor = factory._ctors.get(name)
+        if Ctor is None or not issubclass(Ctor, (DataModel, Record)):
+            return factory.make(name, **d)
+        try: decode = _serializers[Ctor][1]
+        except KeyError: decode = Ctor._compile_serializer()[1]
+        return decode(d)
+
+
+    def _loaded(self):
+        changed = self._changed
+        observe = self.allocator.observe
+        # LazyModels load the models of a pkbin file as they are made
+        for model in list(dict.values(self.data)):
+            model._track(changed)
+            observe(model._id)
             model.load(self)
+        changed.clear()
+        self._deleted.clear()
+        self._added.clear()
+        log('Loaded:', self, len(self.data))
+        self.dispatch('on_loaded')
 
 
 
@@ -633,6 +3260,16 @@ class DataProperty(ObjectProperty):
                          rebind = rebind,
                          **kwargs)
 
+    def set(self, obj, value):
+        if isinstance(value, Record): value = value.observe()
+        old = self.get(obj)
+        changed = super().set(obj, value)
+        # release the hold on a record's observer taken when it was set
+        record = getattr(old, 'record', None)
+        if isinstance(record, Record) and record._observer is old:
+            record.unobserve()
+        return changed
+
 
 
 class SelectorProperty(DataProperty):
@@ -667,8 +3304,7 @@ class DataWidget(Widget):
         return self
 
     def reinit(self, **kwargs):
-        for k, v in kwargs.items():
-            setattr(self, k, v)
+        apply_batch(self, kwargs)
         return self
 
 
@@ -744,6 +3380,10 @@ class DataView(Layout):
     def update(self):
         self.on_update(self.data)
 
+    def on_batch(self, data, events):
+        for event, args in events:
+            getattr(self, event)(data, *args)
+
 
 
 class ListView(DataView):
@@ -773,9 +3413,7 @@ class ListView(DataView):
         self.add_widget(widget, i)
 
     def on_clear(self, data):
-        recycle = self.factory.recycle
-        for widget in self.children:
-            recycle(widget)
+        self.factory.recycle_many(self.children)
         self.clear_widgets()
 
     def on_insert(self, data, i, model):
@@ -783,6 +3421,60 @@ class ListView(DataView):
         i = len(self.children) - i
         self.add_widget(widget, i)
 
+    def on_splice(self, data, start, removed, added):
+        children = self.children
+        last = len(children) - 1
+        widgets = [children[last - i] for i in range(start, start + removed)]
+        remove_widget = self.remove_widget
+        for widget in widgets: remove_widget(widget)
+        self.factory.recycle_many(widgets)
+        if added: self.insert_models(start, added)
+
+    def on_permute(self, data, order):
+        widgets = self.children[::-1]
+        self.children[:] = [widgets[i] for i in reversed(order)]
+
+    def on_roll(self, data, model, left):
+        '''Moves the evicted end's widget to the other end, for model.'''
+        children = self.children
+        if not children: return
+        if left:
+            widget = children.pop(0)
+            children.append(widget)
+        else:
+            widget = children.pop()
+            children.insert(0, widget)
+        widget.recycle().reinit(model=model)
+
+    def insert_models(self, i, models):
+        '''Adds widgets for models at list positions i, i + 1, ...'''
+        kwargs = ({'model': model} for model in models)
+        add_widget = self.add_widget
+        children = self.children
+        for widget in self.factory.make_many(self.cls, kwargs):
+            add_widget(widget, len(children) - i)
+            i += 1
+
+    def on_batch(self, data, events):
+        '''Replays events, making runs of adjacent inserts in one call.'''
+        start, run = 0, []
+        for event, args in events:
+            if event == 'on_insert':
+                if run and args[0] == start + len(run):
+                    run.append(args[1])
+                    continue
+                if run: self.insert_models(start, run)
+                start, model = args
+                run = [model]
+                continue
+
+            if run:
+                self.insert_models(start, run)
+                run = []
+            getattr(self, event)(data, *args)
+
+        if run: self.insert_models(start, run)
+
     def on_swap(self, data, a, b):
         children = self.children
         l =  len(children) - 1
@@ -790,20 +3482,20 @@ class ListView(DataView):
         children[a], children[b] = children[b], children[a]
 
     def on_update(self, data):
-        recycle = self.factory.recycle
-        for widget in self.children: recycle(widget)
+        factory = self.factory
+        factory.recycle_many(self.children)
         self.clear_widgets()
 
         if data:
             add_widget = self.add_widget
-            cls = self.cls
-            make = self.factory.make
-            for model in data: add_widget(make(cls, model=model))
+            models = ({'model': model} for model in data)
+            for widget in factory.make_many(self.cls, models):
+                add_widget(widget)
 
 
 
 
-class DictView(Layout):
+class DictView(DataView):
     '''Layout that keeps children in sync with data.'''
 
     data = CollectionProperty(baseclass=DataDict)
@@ -831,33 +3523,30 @@ class DictView(Layout):
         self.add_widget(widget)
 
     def on_clear(self, data):
-        recycle = self.factory.recycle
-        for widget in self.children:
-            recycle(widget)
+        self.factory.recycle_many(self.children)
         self.widgets.clear()
         self.clear_widgets()
 
 
     def on_update(self, data):
         widgets = self.widgets
-        recycle = self.factory.recycle
-        for widget in self.children: recycle(widget)
+        factory = self.factory
+        factory.recycle_many(self.children)
         self.clear_widgets()
-        self.widgets.clear()
+        widgets.clear()
 
         if data:
             add_widget = self.add_widget
-            cls = self.cls
-            make = self.factory.make
-            for key, model in data:
-                widget = make(cls, model=model)
+            keys = list(data.keys())
+            models = ({'model': model} for model in data.values())
+            for key, widget in zip(keys, factory.make_many(self.cls, models)):
                 add_widget(widget)
                 widgets[key] = widget
 
 
 
 
-class SetView(Layout):
+class SetView(DataView):
     '''Layout that keeps children in sync with data.'''
 
     data = CollectionProperty(baseclass=DataSet)
@@ -883,25 +3572,23 @@ class SetView(Layout):
         self.add_widget(widget)
 
     def on_clear(self, data):
-        recycle = self.factory.recycle
-        for widget in self.children:
-            recycle(widget)
+        self.factory.recycle_many(self.children)
         self.widgets.clear()
         self.clear_widgets()
 
     def on_update(self, data):
         widgets = self.widgets
-        recycle = self.factory.recycle
-        for widget in self.children: recycle(widget)
+        factory = self.factory
+        factory.recycle_many(self.children)
         self.clear_widgets()
-        self.widgets.clear()
+        widgets.clear()
 
         if data:
             add_widget = self.add_widget
-            cls = self.cls
-            make = self.factory.make
-            for model in data:
-                widget = make(cls, model=model)
+            models = list(data)
+            kwargs = ({'model': model} for model in models)
+            made = factory.make_many(self.cls, kwargs)
+            for model, widget in zip(models, made):
                 add_widget(widget)
                 widgets[id(model)] = widget
 
@@ -913,12 +3600,19 @@ class ReducerProperty(CollectionProperty):
     Instead of binding to callbacks of event names on the host like the
     CollectionProperty, the RecyclerProperty accepts a target
     CollectionProperty to update with the contents yielded by generator.
+    If the host implements reduce_{target}(event, collection, *args) every
+    event is bound to it instead of update_{target}.
+
+    With coalesce=True events only mark the host dirty and update_{target}
+    runs once on the next Clock frame. flush(host) runs a pending update
+    immediately.
     '''
 
-    def __init__(self, target_name, **kwargs):
+    def __init__(self, target_name, coalesce=False, **kwargs):
         super().__init__(**kwargs)
         self.factory = factory
         self.target_name = target_name
+        self.coalesce = coalesce
 
 
     def _bind(self, host, collection):
@@ -926,16 +3620,24 @@ class ReducerProperty(CollectionProperty):
         uid_propname = '_uids_{}'.format(self.name)
         uids = getattr(host, uid_propname, [])
         update = getattr(host, 'update_{}'.format(self.target_name))
+        reduce = getattr(host, 'reduce_{}'.format(self.target_name), None)
 
-        # # bind every event to update()
+        if self.coalesce:
+            trigger_name = '_trigger_{}'.format(self.name)
+            update = getattr(host, trigger_name, None)
+            if update is None:
+                update = Clock.create_trigger(lambda dt: self._update(host))
+                setattr(host, trigger_name, update)
+            reduce = None
+
+        # # bind every event to update(), or to reduce(event, ...)
         for event in collection.events:
-            uids.append(fbind(event, update))
+            if reduce is None: uids.append(fbind(event, update))
+            else: uids.append(fbind(event, reduce, event))
 
         setattr(host, uid_propname, uids)
         log('Bound collection', host, uid_propname, collection)
 
-        update(collection)
-
 
     def _unbind(self, host, old_collection):
         uids = getattr(host, '_uids_{}'.format(self.name))
@@ -944,53 +3646,424 @@ class ReducerProperty(CollectionProperty):
         for event in reversed(old_collection.events):
             unbind_uid(event, uids.pop())
 
+        trigger = getattr(host, '_trigger_{}'.format(self.name), None)
+        if trigger is not None: trigger.cancel()
+
+
+    def _update(self, host):
+        collection = self.get(host)
+        if collection is not None:
+            getattr(host, 'update_{}'.format(self.target_name))(collection)
+
+
+    def flush(self, host):
+        '''Runs the update of host now if one is pending.'''
+        trigger = getattr(host, '_trigger_{}'.format(self.name), None)
+        if trigger is None or not trigger.is_triggered: return
+        trigger.cancel()
+        self._update(host)
+
 
     def set(self, host, collection):
         super().set(host, collection)
+        if collection is not None:
+            getattr(host, 'update_{}'.format(self.target_name))(collection)
         return True
 
 
 
+class ReducerStage(object):
+    '''
+    One step of an incremental list reduction. reset(items) rebuilds the
+    stage from its whole input and returns its whole output. apply(ops)
+    takes positional changes to the input and returns the changes they
+    make to the output, where an op is one of ('insert', i, x),
+    ('delete', i) or ('set', i, x). Subclasses implement reset and the
+    insert, delete and set methods, each returning a list of ops.
+    '''
+
+    def apply(self, ops):
+        out = []
+        for op in ops:
+            out.extend(getattr(self, op[0])(*op[1:]))
+        return out
+
+    def reset(self, items): return list(items)
+    def insert(self, i, x): return [('insert', i, x)]
+    def delete(self, i): return [('delete', i)]
+    def set(self, i, x): return [('set', i, x)]
+
+
+
+class _Mask(object):
+    '''
+    A list of booleans held in blocks, with Fenwick trees of the blocks'
+    lengths and true counts. insert, pop, item access and count(i), the
+    number of true values before position i, take O(log n) steps plus
+    work within one block.
+    '''
+    block = 256
+
+    def __init__(self, values=()):
+        values = [bool(value) for value in values]
+        size = self.block
+        self.blocks = [values[i:i + size]
+                       for i in range(0, len(values), size)] or [[]]
+        self._rebuild()
+
+    def __len__(self): return self.length
+
+    def _rebuild(self):
+        blocks = self.blocks
+        n = len(blocks)
+        lengths, counts = [0] * (n + 1), [0] * (n + 1)
+        for j, block in enumerate(blocks, 1):
+            lengths[j] += len(block)
+            counts[j] += sum(block)
+            parent = j + (j & -j)
+            if parent <= n:
+                lengths[parent] += lengths[j]
+                counts[parent] += counts[j]
+        self.lengths, self.counts = lengths, counts
+        self.length = sum(len(block) for block in blocks)
+        self._top = 1 << n.bit_length() - 1
+
+    @staticmethod
+    def _add(tree, j, delta):
+        j += 1
+        n = len(tree)
+        while j < n:
+            tree[j] += delta
+            j += j & -j
+
+    @staticmethod
+    def _prefix(tree, j):
+        total = 0
+        while j:
+            total += tree[j]
+            j -= j & -j
+        return total
+
+    def _locate(self, i):
+        '''Returns the block holding position i and i's offset in it.'''
+        lengths, n = self.lengths, len(self.blocks)
+        j, step = 0, self._top
+        while step:
+            if j + step <= n and lengths[j + step] <= i:
+                j += step
+                i -= lengths[j]
+            step >>= 1
+        if j == n: return n - 1, len(self.blocks[-1]) + i # at the end
+        return j, i
+
+    def count(self, i):
+        '''Returns the number of true values before position i.'''
+        j, k = self._locate(i)
+        return self._prefix(self.counts, j) + sum(self.blocks[j][:k])
+
+    def __getitem__(self, i):
+        j, k = self._locate(i)
+        return self.blocks[j][k]
+
+    def __setitem__(self, i, value):
+        j, k = self._locate(i)
+        block = self.blocks[j]
+        value = bool(value)
+        if block[k] != value: self._add(self.counts, j, value - block[k])
+        block[k] = value
+
+    def insert(self, i, value):
+        j, k = self._locate(i)
+        block = self.blocks[j]
+        value = bool(value)
+        block.insert(k, value)
+        self.length += 1
+        if len(block) > 2 * self.block:
+            half = len(block) >> 1
+            self.blocks[j:j + 1] = [block[:half], block[half:]]
+            self._rebuild()
+            return
+        self._add(self.lengths, j, 1)
+        if value: self._add(self.counts, j, 1)
+
+    def pop(self, i):
+        j, k = self._locate(i)
+        blocks = self.blocks
+        value = blocks[j].pop(k)
+        self.length -= 1
+        if not blocks[j] and len(blocks) > 1:
+            del blocks[j]
+            self._rebuild()
+            return value
+        self._add(self.lengths, j, -1)
+        if value: self._add(self.counts, j, -1)
+        return value
+
+
+
+class FilterStage(ReducerStage):
+    '''
+    Passes the items for which predicate(item) is true. Which items pass is
+    kept in a _Mask, so each change costs O(log n).
+    '''
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.mask = _Mask()
+        self.count = 0
+
+    def _output_index(self, i):
+        return self.mask.count(i)
+
+    def reset(self, items):
+        predicate = self.predicate
+        items = list(items)
+        keeps = [bool(predicate(x)) for x in items]
+        self.mask = _Mask(keeps)
+        self.count = sum(keeps)
+        return [x for x, keep in zip(items, keeps) if keep]
+
+    def insert(self, i, x):
+        keep = bool(self.predicate(x))
+        self.mask.insert(i, keep)
+        if not keep: return []
+        self.count += 1
+        return [('insert', self._output_index(i), x)]
+
+    def delete(self, i):
+        if not self.mask.pop(i): return []
+        self.count -= 1
+        return [('delete', self._output_index(i))]
+
+    def set(self, i, x):
+        was, keep = self.mask[i], bool(self.predicate(x))
+        self.mask[i] = keep
+        self.count += keep - was
+        if was and keep: return [('set', self._output_index(i), x)]
+        if was: return [('delete', self._output_index(i))]
+        if keep: return [('insert', self._output_index(i), x)]
+        return []
+
+
+
+class MapStage(ReducerStage):
+    '''Passes function(item) for each item.'''
+
+    def __init__(self, function):
+        self.function = function
+
+    def reset(self, items): return [self.function(x) for x in items]
+    def insert(self, i, x): return [('insert', i, self.function(x))]
+    def set(self, i, x): return [('set', i, self.function(x))]
+
+
+
+class _Descending(object):
+    '''Wraps a sort key so that it orders descending.'''
+    __slots__ = ('key',)
+
+    def __init__(self, key): self.key = key
+    def __lt__(self, other): return other.key < self.key
+    def __eq__(self, other): return self.key == other.key
+
+
+
+class SortStage(ReducerStage):
+    '''
+    Passes the items ordered by key(item). Items with equal keys keep their
+    input order, reverse or not, so inserting an item gives the output a
+    reset would. Each entry is [key, label], where labels increase along
+    the input and a new item takes the midpoint of its neighbours'.
+    '''
+
+    def __init__(self, key=None, reverse=False):
+        self.key = (lambda x: x) if key is None else key
+        self.reverse = reverse
+        self.entries = []   # [key, label] in input order
+        self.ordered = []   # the same entries in output order
+
+    def _sort_key(self, x):
+        key = self.key(x)
+        return _Descending(key) if self.reverse else key
+
+    def _label(self, i):
+        entries = self.entries
+        if not entries: return 0.0
+        if i == 0: return entries[0][1] - 1
+        if i == len(entries): return entries[-1][1] + 1
+        lo, hi = entries[i - 1][1], entries[i][1]
+        label = (lo + hi) / 2
+        if lo < label < hi: return label
+        # out of precision: relabel, which keeps the order of ordered
+        for n, entry in enumerate(entries): entry[1] = float(n)
+        return i - 0.5
+
+    def reset(self, items):
+        sort_key = self._sort_key
+        items = list(items)
+        entries = self.entries = [[sort_key(x), float(n)]
+                                  for n, x in enumerate(items)]
+        order = sorted(range(len(items)), key=entries.__getitem__)
+        self.ordered = [entries[n] for n in order]
+        return [items[n] for n in order]
+
+    def insert(self, i, x):
+        entry = [self._sort_key(x), self._label(i)]
+        self.entries.insert(i, entry)
+        ordered = self.ordered
+        j = bisect_left(ordered, entry)
+        ordered.insert(j, entry)
+        return [('insert', j, x)]
+
+    def delete(self, i):
+        entry = self.entries.pop(i)
+        ordered = self.ordered
+        j = bisect_left(ordered, entry)
+        del ordered[j]
+        return [('delete', j)]
+
+    def set(self, i, x):
+        ops = self.delete(i) + self.insert(i, x)
+        if ops[0][1] == ops[1][1]: return [('set', ops[1][1], x)]
+        return ops
+
+
+
+class LimitStage(ReducerStage):
+    '''Passes the first n items.'''
+
+    def __init__(self, n):
+        self.n = n
+        self.items = []
+
+    def reset(self, items):
+        self.items = list(items)
+        return self.items[:self.n]
+
+    def insert(self, i, x):
+        items, n = self.items, self.n
+        items.insert(i, x)
+        if i >= n: return []
+        if len(items) > n: return [('delete', n - 1), ('insert', i, x)]
+        return [('insert', i, x)]
+
+    def delete(self, i):
+        items, n = self.items, self.n
+        del items[i]
+        if i >= n: return []
+        if len(items) >= n: return [('delete', i), ('insert', n-1, items[n-1])]
+        return [('delete', i)]
+
+    def set(self, i, x):
+        self.items[i] = x
+        return [('set', i, x)] if i < self.n else []
+
+
+
 class ListReducerView(ListView):
+    '''
+    Keeps displayed matched to gen_displayed(), which by default yields
+    data passed through self.stages. With stages, each event from data is
+    pushed through the stages as positional ops, so its cost scales with
+    the change instead of with the size of data. Events without a
+    positional payload, such as on_update and on_permute, re-run the
+    stages in full.
+
+    A query(data) callable returning positions, such as the index arrays
+    of DataTable.where() and argsort(), selects and orders the rows fed
+    to the stages in place of all of data. Any event then re-runs it.
+    '''
 
     displayed = CollectionProperty(baseclass=DataList)
     data = ReducerProperty('displayed')
     def detach(self): self.displayed = None; self.data = None
-
-    def __init__(self, displayed=None, **kwargs):
-        if displayed is None: self.displayed = factory.make('DataList')
+    def flush(self): self.property('data').flush(self)
+
+    def __init__(self, displayed=None, stages=(), query=None, **kwargs):
+        self.stages = list(stages)
+        self.query = query
+        self._source = []
+        if displayed is None:
+            self.displayed = factory.make('DataList', indexed=True)
         else: self.displayed = displayed
         super().__init__(**kwargs)
 
 
     def update_displayed(self, *evt_args):
-        '''
-        Step through the current list and match in place.
-        Requires target DataCollection to implement swap!
-        (i.e. this should go in the ListReducer)
-        '''
-        displayed = self.displayed
-        index = -1
-
-        for model in self.gen_displayed():
-            index += 1
-            try:
-                current = displayed[index]
-                if current is not model:
-                    i = displayed.index(model)
-                    displayed.swap(index, i)
-                    log('update: swapped', current.name, model.name)
-                continue
-            except (IndexError, ValueError): pass
+        '''Match displayed to gen_displayed() with DataList.match.'''
+        self.displayed.match(self.gen_displayed())
+        log('update: matched', len(self.displayed))
 
-            displayed.insert(index, model)
-            log('update: inserted', model.name)
 
-        for i in reversed(range(index + 1, len(displayed))):
-            del displayed[i]
+    def reduce_displayed(self, event, collection, *args):
+        '''Pushes one event from data through the stages into displayed.'''
+        if not self.stages or self.query is not None:
+            return self.update_displayed()
 
+        ops = self._source_ops(event, args)
+        if ops is None: return self.update_displayed()
+        for stage in self.stages:
+            ops = stage.apply(ops)
 
-    def gen_displayed(self): return iter(self.data)
+        displayed = self.displayed
+        with displayed.batch():
+            for op in ops:
+                if op[0] == 'insert': displayed.insert(op[1], op[2])
+                elif op[0] == 'delete': del displayed[op[1]]
+                else: displayed[op[1]] = op[2]
+
+
+    def _source_ops(self, event, args):
+        '''Translates an event into ops, updating the mirror of data.'''
+        source = self._source
+        if event == 'on_insert':
+            source.insert(*args)
+            return [('insert',) + args]
+        if event == 'on_del':
+            del source[args[0]]
+            return [('delete', args[0])]
+        if event == 'on_set':
+            source[args[0]] = args[1]
+            return [('set',) + args]
+        if event == 'on_swap':
+            a, b = args
+            source[a], source[b] = source[b], source[a]
+            return [('set', a, source[a]), ('set', b, source[b])]
+        if event == 'on_splice':
+            start, removed, added = args
+            source[start:start + removed] = added
+            ops = [('delete', start)] * removed
+            ops.extend(('insert', start + i, x) for i, x in enumerate(added))
+            return ops
+        if event == 'on_roll':
+            x, left = args
+            if left:
+                last = len(source) - 1
+                del source[last]
+                source.insert(0, x)
+                return [('delete', last), ('insert', 0, x)]
+            del source[0]
+            source.append(x)
+            return [('delete', 0), ('insert', len(source) - 1, x)]
+        if event == 'on_batch':
+            ops = []
+            for event, args in args[0]:
+                more = self._source_ops(event, args)
+                if more is None: return None
+                ops.extend(more)
+            return ops
+        return None
+
+
+    def gen_displayed(self):
+        data = self.data
+        if self.query is not None:
+            data = [data[i] for i in self.query(data)]
+        if not self.stages: return iter(data)
+        items = self._source = list(data)
+        for stage in self.stages:
+            items = stage.reset(items)
+        return iter(items)
 
 
 
@@ -1002,50 +4075,38 @@ class DequeReducerView(ListView):
     displayed_total = NumericProperty(10)
 
     def detach(self): self.displayed = None; self.data = None
+    def flush(self): self.property('data').flush(self)
     def on_displayed_index(self, _, index): self.update_displayed()
     def on_displayed_total(self, _, index): self.update_displayed()
 
     def __init__(self, displayed=None, **kwargs):
-        if displayed is None: self.displayed = factory.make('DataDeque')
+        if displayed is None:
+            self.displayed = factory.make('DataDeque', indexed=True)
         else: self.displayed = displayed
         super().__init__(**kwargs)
 
-
-    def update_displayed(self, *evt_args):
+    def reduce_displayed(self, event, data, *args):
         '''
-        Like list but with special case first entry
+        Mirrors an on_roll of data into displayed while the window shows
+        all of data, so the rolled widget is reused. Otherwise updates.
         '''
-        data = self.data
         displayed = self.displayed
-        index = 0
+        if (event == 'on_roll' and displayed is not None and
+                self.displayed_index == 0 and
+                len(data) <= self.displayed_total and
+                len(displayed) == len(data)):
+            return displayed.roll(*args)
+        self.update_displayed()
 
-        try: model = data[self.displayed_index]
-        except: displayed.clear(); return
-        try: current = displayed[index]
-        except: displayed.append(model)
-        else:
-            if current is not model:
-                try: i = displayed.index(model)
-                except ValueError: displayed.appendleft(model)
-                else: displayed.swap(index, i)
-
-        for index in range(1, self.displayed_total):
-            try: model = data[self.displayed_index + index]
-            except: break
-            try: current = displayed[index]
-            except: pass
-            else:
-                try:
-                    if current is not model:
-                        i = displayed.index(model)
-                        displayed.swap(index, i)
-                    continue
-                except ValueError: pass
-            displayed.insert(index, model)
-        else: index += 1
+    def update_displayed(self, *evt_args):
+        '''Match displayed to the window of data at displayed_index.'''
+        data = self.data
+        displayed = self.displayed
+        if displayed is None: return
+        if data is None: displayed.clear(); return
 
-        for i in reversed(range(index, len(displayed))):
-            del displayed[i]
+        start = self.displayed_index
+        displayed.match(islice(data, start, start + self.displayed_total))
 
 
 
@@ -1070,6 +4131,7 @@ class DictReducerView(DictView):
     displayed = CollectionProperty(baseclass=DataDict)
     data = ReducerProperty('displayed')
     def detach(self): self.displayed = None; self.data = None
+    def flush(self): self.property('data').flush(self)
 
     def __init__(self, displayed=None, **kwargs):
         if displayed is None: self.displayed = factory.make('DataDict')
@@ -1096,25 +4158,31 @@ class SetReducerView(SetView):
     displayed = CollectionProperty(baseclass=DataSet)
     data = ReducerProperty('displayed')
     def detach(self): self.displayed = None; self.data = None
+    def flush(self): self.property('data').flush(self)
 
     def __init__(self, displayed=None, **kwargs):
         if displayed is None: self.displayed = factory.make('DataSet')
         else: self.displayed = displayed
-        super().__init__(displayed=displayed, **kwargs)
+        super().__init__(**kwargs)
 
     def update_displayed(self, *evt_args):
-        # add each value to set; delete symmetric difference
+        # add each value to set; delete the ones no longer yielded
         current_models = set()
         displayed = self.displayed
+        if displayed is None: return
 
         for model in self.gen_displayed():
             current_models.add(model)
             if model not in displayed:
                 displayed.add(model)
 
-        for model in current_models.symmetric_difference(displayed):
+        for model in displayed - current_models:
             displayed.remove(model)
 
+    def gen_displayed(self):
+        data = self.data
+        return iter(()) if data is None else iter(data)
+
 
 
 
@@ -1269,7 +4337,10 @@ class PKApp(App):
 
 
 class Walker(EventDispatcher):
-    '''Convenience class for walking lists.'''
+    '''
+    Convenience class for walking lists.
+    Setting current looks up its index, which is O(1) on an indexed DataList.
+    '''
 
     def _get_index(self):
         return self._index
@@ -0,0 +1,162 @@
+import os
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+import pytest
+from kivy.properties import NumericProperty, ObjectProperty
+
+from pkas import pkas
+from pkas.pkas import (DataDeque, DataList, DataModel, DataSortedList,
+                       DataTable, DataWidget, FileContext, LimitStage,
+                       Record, SortStage, factory, specify)
+
+pkas.LOG = False
+MODES = 'json', 'ndjson', 'marshal', 'marshal.zlib', 'pkbin', 'journal'
+
+
+@specify
+class Holder(DataModel):
+    save = ['held']
+    held = ObjectProperty(None, allownone=True)
+
+
+@specify
+class Ranked(DataModel):
+    save = ['rank']
+    rank = NumericProperty(0)
+
+
+def round_trip(tmp_path, mode, collection, models=()):
+    '''Saves collection held by a model in mode and loads it back.'''
+    filename = str(tmp_path / ('saved.' + mode))
+    context = FileContext(mode=mode, filename=filename)
+    holder = Holder(held=collection)
+    context.put(holder)
+    for model in models: context.put(model)
+    context.save()
+    loaded = FileContext(filename=filename)
+    loaded.load()
+    return loaded[holder._id].held
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_table_round_trip(tmp_path, mode):
+    table = DataTable({'price': float, 'qty': int, 'ok': bool},
+                      data=[(1.5, 2, True), (2.5, 3, False)])
+    loaded = round_trip(tmp_path, mode, table)
+    assert isinstance(loaded, DataTable)
+    assert loaded.dtypes() == table.dtypes()
+    assert [(r.price, r.qty, r.ok) for r in loaded] == [
+        (1.5, 2, True), (2.5, 3, False)]
+    loaded.append({'price': 4.0, 'qty': 1, 'ok': True})
+    assert list(loaded.column('qty')) == [2, 3, 1]
+
+
+def test_pooled_table_loads_saved_schema(tmp_path):
+    factory.recycle(DataTable(['x'], data=[(1.0,)]))
+    table = DataTable({'a': int}, data=[(7,)])
+    loaded = round_trip(tmp_path, 'json', table)
+    assert list(loaded.dtypes()) == ['a']
+    assert loaded[0].a == 7
+
+
+class Tagged(DataModel):
+    tag = ObjectProperty(None, allownone=True)
+
+
+def test_index_drops_empty_buckets():
+    models = [Tagged(tag=0) for i in range(10)]
+    collection = DataList(models)
+    index = collection.add_index('tag', ordered=True)
+    for step in range(500):
+        for i, model in enumerate(models): model.tag = step * 10 + i
+    assert len(index._buckets) == 10
+    assert index.values() == list(range(4990, 5000))
+    assert not index.lookup('missing')
+    assert 'missing' not in index._buckets
+
+
+def test_index_lookup_stays_live():
+    model = Tagged(tag='a')
+    index = DataList([model]).add_index('tag')
+    blue = index.lookup('blue')
+    model.tag = 'blue'
+    assert set(blue) == {model}
+    red = index.lookup('a')
+    model.tag = 'a'
+    assert not blue and set(red) == {model}
+    assert index.lookup('blue') is blue
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_sorted_list_round_trip(tmp_path, mode):
+    models = [Ranked(rank=rank) for rank in (3, 1, 2)]
+    collection = DataSortedList(models, key_property='rank')
+    loaded = round_trip(tmp_path, mode, collection, models)
+    assert loaded.key_property == 'rank'
+    assert [model.rank for model in loaded] == [1, 2, 3]
+    loaded[0].rank = 5
+    assert [model.rank for model in loaded] == [2, 3, 5]
+
+
+def test_recycle_resets_written_properties():
+    model = Ranked(rank=4)
+    for rank in (7, 0, 2):
+        model.recycle()
+        assert model.rank == 0 and not model.is_selected
+        model.reinit(rank=rank)
+        model.is_selected = True
+    model.recycle()
+    assert model.rank == 0 and not model.is_selected
+
+
+def apply_ops(items, ops):
+    for op in ops:
+        if op[0] == 'insert': items.insert(op[1], op[2])
+        elif op[0] == 'delete': del items[op[1]]
+        else: items[op[1]] = op[2]
+    return items
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_sort_insert_matches_reset(reverse):
+    def stages():
+        return [SortStage(key=len, reverse=reverse), LimitStage(2)]
+    source = ['a', 'b']
+    incremental = stages()
+    shown = source
+    for stage in incremental: shown = stage.reset(shown)
+    source.insert(0, 'c')
+    ops = [('insert', 0, 'c')]
+    for stage in incremental: ops = stage.apply(ops)
+    rebuilt = source
+    for stage in stages(): rebuilt = stage.reset(rebuilt)
+    assert apply_ops(shown, ops) == rebuilt == ['c', 'a']
+
+
+class Point(Record):
+    fields = {'x': 0}
+
+
+def test_recycled_widgets_release_observer():
+    specify(DataWidget, 10)
+    point = Point(x=1)
+    widgets = [factory.make('DataWidget', model=point) for i in range(3)]
+    observer = point._observer
+    assert all(widget.model is observer for widget in widgets)
+    for widget in widgets[:2]: factory.recycle(widget)
+    assert point._observer is observer
+    point.x = 2
+    assert widgets[2].model.x == 2
+    widgets[2].model = Point()
+    assert point._observer is None and observer.record is None
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_bounded_deque_round_trip(tmp_path, mode):
+    models = [Ranked(rank=rank) for rank in range(3)]
+    loaded = round_trip(tmp_path, mode, DataDeque(models, maxlen=3), models)
+    assert loaded.maxlen == 3
+    assert [model.rank for model in loaded] == [0, 1, 2]
+    loaded.append(Ranked(rank=3))
+    assert [model.rank for model in loaded] == [1, 2, 3]